@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Answers to earlier questions, looked up by the cosine similarity of the
+# question's embedding. Entries are scoped to the document set they were
+# answered from (the index key), so processing different or changed files
+# never returns an answer drawn from the old vector store.
+# Off by default: the threshold has to be calibrated against the embedder in
+# use. 0.95 was only checked with HashEmbeddings, with text-embedding-ada-002
+# questions that differ in a single entity ("not covered under Health" and
+# "... Auto") score above it.
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '0'))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+
+
+class CachedAnswer:
+    def __init__(self, scope, question, vector, answer, sources):
+        self.scope = scope
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.sources = sources
+        self.created_at = time.time()
+        self.similarity = None  # set on the copy returned by a lookup
+
+
+class AnswerCache:
+    def __init__(self, embedder, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_SIZE):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # id -> CachedAnswer, least recently used first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def embed(self, question):
+        vector = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, scope, vector):
+        with self._lock:
+            self._expire()
+            ids = [key for key, entry in self._entries.items() if entry.scope == scope]
+            if ids:
+                similarities = np.stack([self._entries[key].vector for key in ids]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    entry = self._entries[ids[best]]
+                    found = CachedAnswer(entry.scope, entry.question, entry.vector, entry.answer, entry.sources)
+                    found.similarity = float(similarities[best])
+                    return found
+            self.misses += 1
+            return None
+
+    def put(self, scope, question, vector, answer, sources=()):
+        with self._lock:
+            self._entries[self._next_id] = CachedAnswer(scope, question, vector, answer, list(sources))
+            self._next_id += 1
+            self._expire()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scope=None):
+        # Drops the answers for one document set, or everything
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if scope is None or entry.scope == scope]:
+                del self._entries[key]
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry.created_at < cutoff]:
+            del self._entries[key]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,73 +1,301 @@
 import streamlit as st
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings, HuggingFaceInstructEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
 from htmlTemplet import css, bot_template, user_template
-from langchain.llms import huggingface_hub
+import chunking
+import index_cache
+import metrics
+import pdf_extract
+import vector_index
 import os
 import re
+import time
 load_dotenv()
 openai_api_key = os.getenv("open_api_key")
 
+CHUNK_SEPARATOR = "\n"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# 'summary' keeps recent turns within MEMORY_TOKEN_LIMIT and summarizes older
+# ones, 'buffer' resends the whole conversation every turn
+CHAT_MEMORY = os.getenv("CHAT_MEMORY", "summary")
+MEMORY_TOKEN_LIMIT = int(os.getenv("MEMORY_TOKEN_LIMIT", "1000"))
+# 'hybrid' fuses BM25 keyword and FAISS results, 'dense' is FAISS only
+RETRIEVER = os.getenv("RETRIEVER", "hybrid")
+RERANK = os.getenv("RERANK", "0") == "1"
+# turns shown below the question box, older turns are paged in an expander
+CHAT_WINDOW = 10
+# 'openai' streams the answer into the chat as it is written (OPENAI_API_BASE
+# may point at a compatible local server), 'huggingface' is flan-t5-xxl
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "huggingface")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo-instruct")
+
 
 def get_pdf_text(pdf_docs):
-    text = ''
     try:
-        for pdf in pdf_docs:
-            pdf_reader = PdfReader(pdf)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
+        documents = pdf_extract.extract_documents(pdf_docs, backend='pypdf2')
     except Exception as e:
         st.error(f"Error reading PDF: {e}")
         return None
-    return text
+    for document in documents:
+        st.caption(f"{document.name}: {len(document.pages)} pages in {document.seconds:.2f}s")
+    return ''.join(document.text for document in documents)
 
 def get_text_chunks(row_text):
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(row_text)
-    return chunks
+    chunks = chunking.iter_chunks([(None, [(1, row_text)])], CHUNK_SEPARATOR, CHUNK_SIZE, CHUNK_OVERLAP)
+    return [chunk.text for chunk in chunks]
+
+def get_pdf_chunks(pdf_docs):
+    # pages are chunked as they are extracted, each chunk keeps its file, page and offset
+    documents = ((pdf.name, timed_pages(pdf.name, pdf_extract.iter_pages(pdf, backend='pypdf2')))
+                 for pdf in pdf_docs)
+    return chunking.iter_chunks(documents, CHUNK_SEPARATOR, CHUNK_SIZE, CHUNK_OVERLAP)
+
+def timed_pages(name, pages):
+    # only the time spent extracting counts, batches of chunks are embedded
+    # between pages
+    seconds, count = 0.0, 0
+    pages = iter(pages)
+    while True:
+        started = time.perf_counter()
+        page = next(pages, None)
+        seconds += time.perf_counter() - started
+        if page is None:
+            break
+        count += 1
+        yield page
+    st.caption(f"{name}: {count} pages in {seconds:.2f}s")
+
+# langchain takes seconds to import, so it is only loaded once a document is
+# processed, and the embedder and LLM are built once per process and shared
+# by every session instead of on each rerun
+@st.cache_resource
+def get_embedder():
+    from langchain.embeddings import OpenAIEmbeddings
+    from embedding_store import CachedEmbeddings
+    # only chunks not seen before are sent to OpenAI
+    return CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=openai_api_key))
 
-def get_vector_store(text_chunks):
-    embedder = OpenAIEmbeddings(openai_api_key=openai_api_key)
+def get_vector_store(text_chunks, embedder=None):
+    from langchain.vectorstores import FAISS
+    embedder = embedder or get_embedder()
     #embeddings = HuggingFaceInstructEmbeddings(model_name='hkunlp/instructor-xl')
     vactostore = FAISS.from_texts(texts=text_chunks, embedding=embedder)  
     return vactostore 
+
+def update_document_index(document_index, pdf_docs):
+    # embed only documents that are new, drop the ones no longer uploaded
+    uploaded = {index_cache.file_digest(pdf): pdf for pdf in pdf_docs}
+    for doc_id in set(document_index.documents) - set(uploaded):
+        document_index.remove_document(doc_id)
+    for doc_id, pdf in uploaded.items():
+        if doc_id not in document_index:
+            document_index.add_document(doc_id, get_pdf_chunks([pdf]))
+    return document_index
+
+def get_index_key(pdf_docs):
+    return index_cache.cache_key(
+        pdf_docs,
+        separator=CHUNK_SEPARATOR,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        chunker='stream-v2',
+        embedding=EMBEDDING_MODEL
+    )
+
+def load_cached_vector_store(index_key, compressed=False):
+    path = index_cache.lookup(index_key)
+    if path is None:
+        return None
+    if compressed:
+        vactorstore = vector_index.load_compressed(path, get_embedder())
+        if vactorstore is not None:
+            return vactorstore
+    from langchain.vectorstores import FAISS
+    return FAISS.load_local(path, get_embedder())
+
+def load_serving_store(index_key):
+    vactorstore = load_cached_vector_store(index_key, compressed=vector_index.INDEX_MODE == 'ivfpq')
+    if vactorstore is None:
+        return None
+    return vector_index.serving_store(vactorstore, index_cache.lookup(index_key), get_embedder())
+
+def persist_vector_store(index_key, vactorstore):
+    # an index leaving memory must still be on disk to be loaded again. A compressed
+    # store is never saved as the entry's flat index: it is lossy and cannot have
+    # documents removed. Its entry is pinned while it is in memory, so it is only
+    # missing when another process evicted it, and then the files are processed again
+    if index_cache.lookup(index_key) is None and not vector_index.is_compressed(vactorstore):
+        index_cache.store(index_key, vactorstore)
+
+def count_documents(vactorstore):
+    doc_ids = set()
+    for docstore_id in vactorstore.index_to_docstore_id.values():
+        doc = vactorstore.docstore.search(docstore_id)
+        doc_ids.add(getattr(doc, 'metadata', {}).get('doc_id'))
+    doc_ids.discard(None)
+    return len(doc_ids), len(vactorstore.index_to_docstore_id)
+
+@st.cache_resource
+def get_index_manager():
+    # one copy of each index per process, shared by every session that processed
+    # the same files, least recently used ones are dropped past INDEX_MEMORY_BUDGET_MB
+    from index_manager import IndexManager
+    manager = IndexManager(load_serving_store, get_retriever, persist=persist_vector_store, touch=index_cache.lookup)
+    index_cache.is_pinned = manager.holds
+    return manager
   
-def get_conversation_chain(vactorstore):
-    #llm = ChatOpenAI()
-    llm = huggingface_hub(repo_id='google/flan-t5-xxl', model_kwargs={'temprature':0.5, "max_length":512})
-    memory = ConversationBufferMemory(memory_key='chat_hestory', return_message=True)
+@st.cache_resource
+def get_llm():
+    if LLM_PROVIDER == 'openai':
+        from langchain.llms import OpenAI
+        return OpenAI(model_name=LLM_MODEL, streaming=True, openai_api_key=openai_api_key)
+    from langchain.llms import huggingface_hub
+    #from langchain.chat_models import ChatOpenAI
+    #return ChatOpenAI()
+    return huggingface_hub(repo_id='google/flan-t5-xxl', model_kwargs={'temprature':0.5, "max_length":512})
+
+@st.cache_resource
+def get_answer_cache():
+    # shared by all sessions, answers are scoped by the index key of the documents
+    from answer_cache import AnswerCache, ANSWER_CACHE_SIZE
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    return AnswerCache(get_embedder())
+
+def get_memory(llm):
+    if CHAT_MEMORY == 'buffer':
+        from langchain.memory import ConversationBufferMemory
+        return ConversationBufferMemory(memory_key='chat_history', return_messages=True, output_key='answer')
+    from conversation_memory import TokenBudgetMemory
+    return TokenBudgetMemory(llm=llm, max_token_limit=MEMORY_TOKEN_LIMIT, memory_key='chat_history',
+                             return_messages=True, output_key='answer')
+
+def get_retriever(vactorstore, keyword_index=None):
+    if RETRIEVER == 'dense':
+        return vactorstore.as_retriever()
+    from hybrid_retriever import BM25Index, HybridRetriever, TermOverlapReranker
+    if keyword_index is None:
+        keyword_index = BM25Index.from_vectorstore(vactorstore)
+    return HybridRetriever(vectorstore=vactorstore, keyword_index=keyword_index,
+                           reranker=TermOverlapReranker() if RERANK else None)
+
+def get_conversation_chain(index_key, retriever=None):
+    from langchain.chains import ConversationalRetrievalChain
+    from index_manager import ManagedRetriever
+    llm = get_llm()
+    memory = get_memory(llm)
     conversation_chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
-        retriever=vactorstore.as_retriver,
-        memory=memory
+        # the session keeps the key, the index itself stays with the index manager
+        retriever=retriever or ManagedRetriever(index_key=index_key, manager=get_index_manager()),
+        memory=memory,
+        return_source_documents=True
     )
     return conversation_chain
 
 
+def render_turn(question, answer):
+    return user_template.replace("{{MSG}}", question) + bot_template.replace("{{MSG}}", answer)
+
+def has_history(conversation):
+    memory = conversation.memory
+    return bool(memory.chat_memory.messages or getattr(memory, 'moving_summary_buffer', ''))
+
+def ask_question(user_question, callbacks=None):
+    # similar questions about the same documents are answered from the cache; only
+    # the first question of a conversation, a follow-up is condensed with this
+    # session's history and means something else in another session
+    conversation = st.session_state.conversation
+    answer_cache = get_answer_cache()
+    if answer_cache is None or has_history(conversation):
+        with metrics.span('answer'):
+            return conversation({'question': user_question}, callbacks=callbacks)
+    scope = st.session_state.index_key
+    with metrics.span('answer_cache_lookup'):
+        vector = answer_cache.embed(user_question)
+        cached = answer_cache.get(scope, vector)
+    metrics.inc('answer_cache_total', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        # keep the turn in the memory so follow-up questions still see it
+        conversation.memory.save_context({'question': user_question}, {'answer': cached.answer})
+        return {'answer': cached.answer, 'source_documents': cached.sources, 'cached': cached}
+    with metrics.span('answer'):
+        response = conversation({'question': user_question}, callbacks=callbacks)
+    answer_cache.put(scope, user_question, vector, response['answer'], response.get('source_documents', []))
+    return response
+
 def handle_userinput(user_question):
-    response = st.session_state.conversation({'question': user_question})
-    st.session_state.chat_history = response['chat_history']
+    from chat_streaming import StreamingAnswerHandler
+    from index_manager import IndexUnavailable
+    # the answer is drawn here while it streams, then added to the transcript below
+    live = st.empty()
+    stream = StreamingAnswerHandler(
+        lambda text: live.write(render_turn(user_question, text + '▌'), unsafe_allow_html=True))
+    try:
+        response = ask_question(user_question, callbacks=[stream])
+    except IndexUnavailable:
+        # the saved index was removed, e.g. by another process's cache eviction
+        live.empty()
+        st.warning('The index of your documents is no longer available, click "process" to index them again.')
+        return
+    live.empty()
+    # the memory may only hold a summary of older turns, so the transcript is kept
+    # separately, each turn rendered to HTML once when it is added
+    st.session_state.chat_history.append(render_turn(user_question, response['answer']))
+
+    history_tokens = getattr(st.session_state.conversation.memory, 'history_tokens', None)
+    if 'cached' in response:
+        cached = response['cached']
+        st.caption(f"Answered from cache: \"{cached.question}\" (similarity {cached.similarity:.2f})")
+    elif history_tokens:
+        st.caption(f"Chat history sent with this question: {history_tokens[-1]} tokens")
+    if stream.first_token_seconds is not None:
+        st.caption(f"First token after {stream.first_token_seconds:.2f}s")
+
+    # cite the pages the answer was drawn from
+    sources = sorted({(doc.metadata['source'], doc.metadata['page'])
+                      for doc in response.get('source_documents', []) if 'page' in doc.metadata})
+    if sources:
+        st.caption('Sources: ' + ', '.join(f'{source} p.{page}' for source, page in sources))
+
+def get_history_page(page, end):
+    # full pages of older turns never change, so their joined HTML is kept
+    turns = st.session_state.chat_history
+    start = page * CHAT_WINDOW
+    stop = min(start + CHAT_WINDOW, end)
+    if stop - start < CHAT_WINDOW:
+        return ''.join(turns[start:stop])
+    pages = st.session_state.chat_history_pages
+    if page not in pages:
+        pages[page] = ''.join(turns[start:stop])
+    return pages[page]
+
+def render_chat_history():
+    turns = st.session_state.chat_history
+    older = len(turns) - CHAT_WINDOW
+    if older > 0:
+        with st.expander(f"Earlier messages ({older})"):
+            pages = -(-older // CHAT_WINDOW)
+            page = st.number_input('Page', min_value=1, max_value=pages, value=pages) if pages > 1 else 1
+            st.write(get_history_page(page - 1, older), unsafe_allow_html=True)
+    if turns:
+        st.write(''.join(turns[-CHAT_WINDOW:]), unsafe_allow_html=True)
+
+
+def render_metrics_panel():
+    # timings of every stage run in this server process, slowest on average first
+    rows = sorted(metrics.registry.stage_summary(), key=lambda row: -row[2])
+    if not rows:
+        st.caption('No timings recorded yet')
+        return
+    table = ['| stage | runs | mean ms | max ms |', '| --- | ---: | ---: | ---: |']
+    table += [f"| {stage} | {count} | {mean * 1000:.1f} | {longest * 1000:.1f} |" for stage, count, mean, longest in rows]
+    st.markdown('\n'.join(table))
+    recent = list(metrics.registry.recent)[-10:]
+    st.caption('Latest: ' + ', '.join(f"{span.name} {span.seconds * 1000:.0f} ms" for span in reversed(recent)))
+
 
-    for i, message in enumerate(st.session_state.chat_history):
-        if i % 2 == 0:
-            st.write(user_template.replace(
-                "{{MSG}}", message.content), unsafe_allow_html=True)
-        else:
-            st.write(bot_template.replace(
-                "{{MSG}}", message.content), unsafe_allow_html=True)
-            
-            
 def main():
     load_dotenv()
     st.set_page_config(page_title='Chat with your Insurance Document', page_icon=':books:')
@@ -76,13 +304,23 @@ def main():
     if 'conversation' not in st.session_state:
         st.session_state.conversation = None
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = None
+        st.session_state.chat_history = []
+        st.session_state.chat_history_pages = {}
+        st.session_state.index_key = None
 
     st.header('Chat with your Insurance Document :books:')
-    user_questions = st.text_input('Write your question here: ')
+    # every widget change reruns the script, a question is only asked when it is
+    # submitted, so the same question can be asked again
+    with st.form('question'):
+        user_questions = st.text_input('Write your question here: ')
+        submitted = st.form_submit_button('Ask')
 
-    if user_questions:
-        handle_userinput(user_questions)
+    if submitted and user_questions:
+        if st.session_state.conversation is None:
+            st.warning('Upload your documents and click on "process" before asking a question.')
+        else:
+            handle_userinput(user_questions)
+    render_chat_history()
 
     with st.sidebar:
         st.subheader('Your documents')
@@ -91,21 +329,67 @@ def main():
         
         if st.button('process'):
             with st.spinner('processing'):
-                #get the text
-                row_text = get_pdf_text(pdf_docs)
-                if row_text is not None:
-                    # get the text chunks
-                    text_chunks = get_text_chunks(row_text)
-                    st.write(text_chunks)
+                # reuse the index built for the same files and settings, the copy another
+                # session already has in memory or else the one saved on disk
+                index_key = get_index_key(pdf_docs)
+                from document_index import DocumentIndex
+                embedder = get_embedder()
+                index_manager = get_index_manager()
+                hits, misses = embedder.hits, embedder.misses
+                with metrics.span('index_load'):
+                    entry = index_manager.get(index_key)
+                if entry is None:
+                    # otherwise update a private copy of the previous index with the changed
+                    # documents only, the one in memory may be searched by other sessions
+                    document_index = None
+                    if st.session_state.index_key is not None:
+                        previous = load_cached_vector_store(st.session_state.index_key)
+                        if previous is not None:
+                            document_index = DocumentIndex.from_vectorstore(previous, embedder)
+                    if document_index is None:
+                        document_index = DocumentIndex(embedder)
+                    try:
+                        with metrics.span('index_update'):
+                            update_document_index(document_index, pdf_docs)
+                    except Exception as e:
+                        # nothing is cached under the key of a file set that was not fully indexed
+                        st.error(f"Error reading PDF: {e}")
+                    else:
+                        st.caption(f"Embeddings: {embedder.hits - hits} reused, {embedder.misses - misses} new")
+                        if document_index.documents:
+                            vactorstore = document_index.vectorstore
+                            with metrics.span('index_store'):
+                                folder = index_cache.store(index_key, vactorstore)
+                            # in ivfpq mode large indexes are searched through a memory-mapped compressed copy
+                            vactorstore = vector_index.serving_store(vactorstore, folder, embedder)
+                            entry = index_manager.put(index_key, vactorstore, document_index.keyword_index)
+                            # answers cached for this key came from an index that is gone
+                            answer_cache = get_answer_cache()
+                            if answer_cache is not None:
+                                answer_cache.invalidate(index_key)
+                        else:
+                            st.error("Failed to read the PDF. Please upload a different file.")
 
-                    # create vactore store
-                    vactorstore = get_vector_store(text_chunks)
+                if entry is not None:
+                    if st.session_state.conversation is None:
+                        st.session_state.conversation = get_conversation_chain(index_key)
+                        st.session_state.chat_history = []
+                        st.session_state.chat_history_pages = {}
+                    else:
+                        # the chain, its memory and the transcript carry on over the updated documents
+                        st.session_state.conversation.retriever.index_key = index_key
+                    # cached answers are only reused for this exact set of documents
+                    st.session_state.index_key = index_key
+                    documents, chunks = count_documents(entry.vectorstore)
+                    st.caption(f"Indexed {documents} documents, {chunks} chunks")
 
-                    # create conversation chain
-                    st.session_state.conversation = get_conversation_chain(vactorstore)
-                else:
-                    st.error("Failed to read the PDF. Please upload a different file.")
+        if st.session_state.index_key is not None:
+            index_stats = get_index_manager().stats()
+            st.caption(f"Indexes in memory: {index_stats['resident']}, "
+                       f"{index_stats['bytes'] / 2**20:.1f} of {index_stats['budget_bytes'] / 2**20:.0f} MB")
 
+        if metrics.registry.enabled and st.checkbox('Show timings'):
+            render_metrics_panel()
 
 
 
@@ -0,0 +1,61 @@
+"""Chart data feed: fetchall against fetchmany streaming and SQL aggregation.
+
+    python -m benchmarks.bench_chart_feed --policies 5000 --categories 8 --items 10
+
+Fills a temporary database through db.insert_policy, then builds the visu.py
+sunburst tree three ways and reports time and peak Python memory (tracemalloc)
+for each: the per-row tree from a fetchall() list, the same tree from the
+db.iter_rows stream, and the per-category tree from AGGREGATE_QUERY.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import db
+import visu
+from benchmarks.fixtures import populate
+
+ROW_QUERY = '''
+    SELECT p.id, p.total_coverage_amount, p.type_of_insurance, p.annual_premium, p.insurer,
+           p.insured, p.issue_date, p.renewal_date, p.policy_number,
+           c.category_name, c.covered, c.not_covered
+    FROM insurance_policies p
+    LEFT JOIN categories c ON p.id = c.policy_id
+    '''
+
+
+def measure(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    tree = build()
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return tree, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--policies', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--items', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        populate(db_path, args.policies, args.categories, args.items)
+        cases = [
+            ('fetchall rows', lambda: visu.build_sunburst_tree_from_db(visu.fetch_data_from_db(db_path, ROW_QUERY))),
+            ('streamed rows', lambda: visu.build_sunburst_tree_from_db(visu.iter_data_from_db(db_path, ROW_QUERY))),
+            ('aggregated', lambda: visu.build_sunburst_tree_from_aggregates(*visu.fetch_aggregates_from_db(db_path))),
+        ]
+        for name, build in cases:
+            tree, seconds, peak = measure(build)
+            print(f"{name:14} {len(tree):>9} nodes {seconds:8.3f}s  peak {peak / 2**20:8.1f} MiB")
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
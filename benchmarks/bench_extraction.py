@@ -0,0 +1,87 @@
+"""Segmented policy extraction against the rate limited fake model server.
+
+    python -m benchmarks.bench_extraction --pages 20 --latency 0.3 --rate-limit-every 3
+
+Builds a synthetic policy of --pages pages whose summary lines are spread
+over its length, one field per stretch of clauses, so every field is found
+by a different segment. policy_extraction.query_openai_and_parse splits it,
+extracts the segments EXTRACTION_CONCURRENCY at a time and merges them,
+while the server answers every --rate-limit-every th request with 429 and
+the calls are retried. The merged InsurancePolicyInfo must equal what one
+call over the whole text parses; the script exits with status 1 when it
+does not. Its time is reported against that single call, which a real model
+could not make for a long policy but which is the latency floor.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+from benchmarks import synthetic_pdfs
+from benchmarks.fake_llm_server import fake_completion, start_server
+
+
+def spread_policy(pages, seed=0):
+    # the summary of synthetic_pdfs with its clauses dealt out between the fields;
+    # a category list keeps its details lines, as in a policy's table of cover
+    rng = random.Random(seed)
+    summary = synthetic_pdfs.policy_summary(rng, 0)
+    start = next(i for i, line in enumerate(summary) if line.startswith('Categories of Insurance Covered'))
+    sections = summary[:start] + ['\n'.join(summary[start:])]
+    clauses = '\n'.join(synthetic_pdfs.policy_pages(0, pages, seed)).split('\n\n')[1:]
+    per_section = max(1, len(clauses) // len(sections))
+    return '\n\n'.join(section + '\n\n' + '\n\n'.join(clauses[i * per_section:(i + 1) * per_section])
+                       for i, section in enumerate(sections))
+
+
+def timed(fn, runs):
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - started)
+    return result, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help='length of the synthetic policy')
+    parser.add_argument('--latency', type=float, default=0.3, help='fake server delay per call')
+    parser.add_argument('--rate-limit-every', type=int, default=3, help='answer every Nth request with 429')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, rate_limit_every=args.rate_limit_every)
+    # read at import time, the fake server accepts any key
+    os.environ.setdefault('OPENAI_API_KEY', 'fake')
+    import map_reduce
+    import policy_extraction
+    policy_extraction.get_openai().api_base = server.url
+
+    text = spread_policy(args.pages, args.seed)
+    segments = len(map_reduce.split_segments(text))
+    rounds = math.ceil(segments / map_reduce.MAX_CONCURRENCY)
+    expected = policy_extraction.parse_openai_response(fake_completion(policy_extraction.EXTRACTION_PROMPT + text))
+    merged, segmented = timed(lambda: policy_extraction.query_openai_and_parse(text), args.runs)
+    _, single = timed(lambda: policy_extraction.query_openai_segment(text), args.runs)
+
+    print(f"{len(text)} characters in {segments} segments of up to {map_reduce.SEGMENT_SIZE}, "
+          f"{rounds} rounds of {map_reduce.MAX_CONCURRENCY} calls")
+    print(f"segmented   {statistics.median(segmented):7.3f}s median")
+    print(f"single call {statistics.median(single):7.3f}s median "
+          f"({statistics.median(segmented) / statistics.median(single):.1f}x)")
+    mismatched = [field for field, value in expected.to_dict().items() if merged.to_dict()[field] != value]
+    for field in mismatched:
+        print(f"{field}: merged {merged.to_dict()[field]!r}, expected {expected.to_dict()[field]!r}")
+    server.shutdown()
+    if mismatched:
+        sys.exit(1)
+    print('merged policy matches the single call')
+
+
+if __name__ == '__main__':
+    main()
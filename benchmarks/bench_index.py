@@ -0,0 +1,121 @@
+"""Vector index modes: flat FAISS in RAM against memory-mapped IVF-PQ.
+
+    python -m benchmarks.bench_index --vectors 50000 --dim 768 --queries 500 --k 10
+
+Builds a clustered synthetic corpus, saves it the way index_cache does
+(FAISS.save_local) and writes the compressed copy with vector_index. Each
+mode is then loaded and queried in a fresh process that reports its resident
+memory: anonymous (private to the process) and file-backed (page cache,
+shared by every process mapping the same file). Recall@k is measured
+against exact search over the original vectors.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import vector_index
+
+CHILD = '''
+import json, sys, time
+import numpy as np
+
+def rss():
+    values = {}
+    for line in open('/proc/self/status'):
+        if line.startswith(('RssAnon', 'RssFile')):
+            key, value = line.split(':')
+            values[key] = int(value.split()[0]) / 1024
+    return values
+
+import faiss
+from embedding_store import HashEmbeddings
+from langchain.vectorstores import FAISS
+import vector_index
+folder, mode, k = sys.argv[1], sys.argv[2], int(sys.argv[3])
+queries = np.load(folder + '/queries.npy')
+before = rss()
+started = time.perf_counter()
+if mode == 'flat':
+    store = FAISS.load_local(folder, HashEmbeddings())
+else:
+    store = vector_index.load_compressed(folder, HashEmbeddings())
+load_seconds = time.perf_counter() - started
+started = time.perf_counter()
+results = [store.index.search(query[None, :], k)[1][0].tolist() for query in queries]
+search_seconds = time.perf_counter() - started
+after = rss()
+print(json.dumps({'load': load_seconds, 'search': search_seconds / len(queries), 'results': results,
+                  'anon': after['RssAnon'] - before['RssAnon'], 'file': after['RssFile'] - before['RssFile']}))
+'''
+
+
+def clustered_vectors(count, dim, clusters, rank=32, seed=0):
+    # Topic clusters in a low-rank subspace plus a little noise, which is
+    # closer to text embeddings than isotropic noise in every dimension
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, dim)).astype(np.float32)
+    centers = rng.standard_normal((clusters, rank)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    latent = centers[labels] + 0.5 * rng.standard_normal((count, rank)).astype(np.float32)
+    return (latent @ basis + 0.1 * rng.standard_normal((count, dim))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[vector_index.IVF_NPROBE])
+    args = parser.parse_args()
+
+    import faiss
+    from langchain.vectorstores import FAISS
+    from embedding_store import HashEmbeddings
+
+    vectors = clustered_vectors(args.vectors + args.queries, args.dim, clusters=max(10, args.vectors // 500))
+    corpus, queries = vectors[:args.vectors], vectors[args.vectors:]
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(corpus)
+    truth = exact.search(queries, args.k)[1]
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = FAISS.from_embeddings([(f'chunk {i}', vector.tolist()) for i, vector in enumerate(corpus)],
+                                      HashEmbeddings())
+        store.save_local(folder)
+        np.save(os.path.join(folder, 'queries.npy'), queries)
+        started = time.perf_counter()
+        vector_index.save_compressed(store, folder)
+        print(f"{args.vectors} x {args.dim}: compressed index trained and written in "
+              f"{time.perf_counter() - started:.1f}s")
+        del store
+
+        sizes = {'flat': os.path.getsize(os.path.join(folder, 'index.faiss')),
+                 'ivfpq': os.path.getsize(os.path.join(folder, f'{vector_index.COMPRESSED_INDEX_NAME}.faiss'))}
+        runs = [('flat', None)] + [('ivfpq', nprobe) for nprobe in args.nprobe]
+        for mode, nprobe in runs:
+            if nprobe is not None:
+                # nprobe is stored in the index file
+                index = faiss.read_index(os.path.join(folder, f'{vector_index.COMPRESSED_INDEX_NAME}.faiss'))
+                vector_index.ivf_part(index).nprobe = nprobe
+                faiss.write_index(index, os.path.join(folder, f'{vector_index.COMPRESSED_INDEX_NAME}.faiss'))
+                del index
+            output = subprocess.run([sys.executable, '-c', CHILD, folder, mode, str(args.k)],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            recall = np.mean([len(set(found) & set(expected)) / args.k
+                              for found, expected in zip(result['results'], truth.tolist())])
+            name = mode if nprobe is None else f'{mode} nprobe={nprobe}'
+            print(f"{name:18} recall@{args.k} {recall:6.3f}  {result['search'] * 1000:7.3f} ms/query  "
+                  f"load {result['load']:6.2f}s  file {sizes[mode] / 2**20:7.1f} MiB  "
+                  f"RSS anon +{result['anon']:7.1f} MiB  file-backed +{result['file']:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
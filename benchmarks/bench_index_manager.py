@@ -0,0 +1,126 @@
+"""Shared indexes under a memory budget: IndexManager against one copy per session.
+
+    python -m benchmarks.bench_index_manager --corpora 8 --chunks 2000 --sessions 40 --questions 400
+
+Builds --corpora document sets of synthetic policy text, embedded with
+HashEmbeddings and saved to an index cache in a temporary directory. First
+checks the size estimate against the memory a loaded store with its BM25
+index actually takes. Then --sessions sessions, each on one corpus
+picked with a skewed popularity, ask --questions questions in random order
+through ManagedRetriever, with the budget set to hold about half the corpora.
+Prints what one copy per session would hold, the most the manager held, and
+the latency of questions answered from memory against those that had to
+load their index from disk first.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic_pdfs import policy_pages
+
+QUESTIONS = ['total coverage amount', 'what is not covered', 'notify the insurer within thirty days',
+             'claims department documents', 'annual premium', 'renewal date']
+
+
+def corpus_chunks(n, chunks, size=1000):
+    # chunks of policy text, numbered through different policies per corpus
+    texts = []
+    policy = n * 1000
+    while len(texts) < chunks:
+        text = '\n'.join(policy_pages(policy, 4))
+        texts.extend(text[i:i + size] for i in range(0, len(text), size))
+        policy += 1
+    return texts[:chunks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpora', type=int, default=8)
+    parser.add_argument('--chunks', type=int, default=2000, help='chunks per corpus')
+    parser.add_argument('--sessions', type=int, default=40)
+    parser.add_argument('--questions', type=int, default=400)
+    parser.add_argument('--budget-mb', type=float, help='default: about half the corpora')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    # settings are read at import time
+    os.environ['INDEX_CACHE_DIR'] = os.path.join(tmp.name, 'index_cache')
+    os.environ['INDEX_CACHE_MAX_ENTRIES'] = str(args.corpora + 1)
+    import index_cache
+    import index_manager
+    import metrics
+    from embedding_store import HashEmbeddings
+    from hybrid_retriever import BM25Index, HybridRetriever
+    from langchain.vectorstores import FAISS
+
+    embedder = HashEmbeddings()
+    keys = []
+    for n in range(args.corpora):
+        texts = corpus_chunks(n, args.chunks)
+        store = FAISS.from_texts(texts, embedder, metadatas=[{'doc_id': f'corpus-{n}'}] * len(texts))
+        keys.append(f'corpus-{n}')
+        index_cache.store(keys[-1], store)
+    del store
+
+    def load(key):
+        path = index_cache.lookup(key)
+        return FAISS.load_local(path, embedder) if path else None
+
+    def build_retriever(vectorstore, keyword_index):
+        keyword_index = keyword_index or BM25Index.from_vectorstore(vectorstore)
+        return HybridRetriever(vectorstore=vectorstore, keyword_index=keyword_index)
+
+    # how close the estimate is to what a loaded store takes
+    # (Python objects traced, plus the FAISS codes allocated outside Python)
+    tracemalloc.start()
+    store = load(keys[0])
+    keyword_index = BM25Index.from_vectorstore(store)
+    measured = tracemalloc.get_traced_memory()[0] + store.index.ntotal * store.index.code_size
+    tracemalloc.stop()
+    estimated = index_manager.estimate_bytes(store, keyword_index)
+    print(f"one corpus: estimated {estimated / 2**20:.1f} MB, measured {measured / 2**20:.1f} MB")
+    del store, keyword_index
+
+    budget = args.budget_mb * 2**20 if args.budget_mb else estimated * args.corpora / 2
+    manager = index_manager.IndexManager(load, build_retriever, persist=None, budget_bytes=budget)
+    rng = random.Random(args.seed)
+    # a few document sets are opened by most sessions
+    weights = [1 / (rank + 1) for rank in range(args.corpora)]
+    sessions = [index_manager.ManagedRetriever(index_key=rng.choices(keys, weights)[0], manager=manager)
+                for _ in range(args.sessions)]
+    metrics.registry.enabled = False
+
+    timings = {'memory': [], 'reload': []}
+    peak = 0
+    for _ in range(args.questions):
+        retriever = rng.choice(sessions)
+        loads = manager.loads
+        started = time.perf_counter()
+        retriever.get_relevant_documents(rng.choice(QUESTIONS))
+        seconds = time.perf_counter() - started
+        timings['reload' if manager.loads > loads else 'memory'].append(seconds)
+        peak = max(peak, manager.stats()['bytes'])
+
+    stats = manager.stats()
+    per_session = estimated * len(sessions)
+    print(f"budget {budget / 2**20:.1f} MB, {len(sessions)} sessions on {len({s.index_key for s in sessions})} "
+          f"of {args.corpora} corpora")
+    print(f"one copy per session   {per_session / 2**20:8.1f} MB")
+    print(f"index manager peak     {peak / 2**20:8.1f} MB, {stats['resident']} resident at the end")
+    print(f"questions: {stats['hits']} from memory, {stats['loads']} loaded from disk, "
+          f"{stats['evictions']} evictions")
+    for name, values in timings.items():
+        if values:
+            print(f"{name:8} median {statistics.median(values) * 1000:8.2f} ms  max {max(values) * 1000:8.2f} ms  "
+                  f"({len(values)} questions)")
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
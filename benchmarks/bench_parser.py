@@ -0,0 +1,141 @@
+"""Throughput of the policy summary parser against the previous regex-per-field version.
+
+    python -m benchmarks.bench_parser --count 20000
+    python -m benchmarks.bench_parser --responses saved_responses/
+
+Saved responses are *.txt files holding raw completion text. Without them a
+batch of synthetic summaries is generated. The old parser's patterns are
+compiled on every call once the batch names more categories than the re
+module caches (512 patterns), --name-pool 8 keeps them all cached.
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import time
+
+import metrics
+import policy_extraction
+
+
+def legacy_extract_value_by_keyword(text, keyword):
+    pattern = rf"{keyword}: ([^\n]+)"
+    match = re.search(pattern, text)
+    if match:
+        return match.group(1).strip()
+    return None
+
+
+def legacy_parse(text):
+    # The parser as it was before policy_parser, returning the same fields
+    get = legacy_extract_value_by_keyword
+    insured_str = get(text, "Name of the Insured")
+    types_str = get(text, "Type of Insurance")
+    categories = {}
+    categories_str = get(text, "Categories of Insurance Covered")
+    if categories_str:
+        for category in [cat.strip() for cat in categories_str.split(',')]:
+            categories[category] = {"covered": [], "not_covered": [], "events_covered": []}
+            covered_str = get(text, f"Details of What is Covered under {category}")
+            if covered_str:
+                categories[category]["covered"] = [item.strip() for item in covered_str.split(',')]
+            not_covered_str = get(text, f"Details of What is Not Covered under {category}")
+            if not_covered_str:
+                categories[category]["not_covered"] = [item.strip() for item in not_covered_str.split(',')]
+    return {
+        'total_coverage_amount': get(text, "Total Coverage Amount"),
+        'annual_premium': get(text, "Annual Premium"),
+        'insurer': get(text, "Name of the Insurer"),
+        'insured': [name.strip() for name in re.split(r' & | and ', insured_str)] if insured_str else [],
+        'issue_date': get(text, "Issue Date"),
+        'renewal_date': get(text, "Renewal Date"),
+        'policy_number': get(text, "Policy Number"),
+        'insurance_types': [t.strip() for t in types_str.split(',')] if types_str else [],
+        'categories': categories,
+    }
+
+
+def parse(text):
+    return policy_extraction.parse_openai_response(text).to_dict()
+
+
+def synthetic_response(rng, categories=8, items=6, name_pool=1000):
+    # Summaries written the ways completions come back: bulleted or bold keys,
+    # two fields on one line, repeated or lower-case keys, empty list items and
+    # details of categories that are not listed, which the parser must treat
+    # as the regex search did. Category names are drawn from name_pool names,
+    # documents name their categories differently
+    names = [f"Category {i}" for i in rng.sample(range(max(name_pool, categories)), categories)]
+    bullet = rng.choice(['', '- ', '* ', '1. '])
+    lines = [
+        "Policy Summary:",
+        f"{bullet}Total Coverage Amount: {rng.randint(1, 900) * 1000:,}",
+        f"{bullet}Type of Insurance: " + ", ".join(rng.sample(["Life", "Health", "Auto", "Home", "Travel"], 2)),
+        f"{bullet}Categories of Insurance Covered: " + ", ".join(names),
+    ]
+    for name in names + [f"Unlisted {rng.randint(0, 9)}"]:
+        covered = [f"Item {rng.randint(0, 999)}" for _ in range(items)]
+        if rng.random() < 0.1:
+            covered.insert(1, "")
+        lines.append(f"{bullet}Details of What is Covered under {name}: " + ", ".join(covered))
+        lines.append(f"{bullet}Details of What is Not Covered under {name}: "
+                     + ", ".join(f"Exclusion {rng.randint(0, 999)}" for _ in range(items)))
+    if rng.random() < 0.3:
+        lines.append("policy number: lower-case key")
+    lines += [
+        rng.choice([f"{bullet}Annual Premium: {rng.randint(1, 90) * 100:,}", "**Annual Premium:** 1,200"]),
+        "Name of the Insurer: Acme Insurance",
+        "Name of the Insured: John Doe and Jane Doe",
+        rng.choice(["Issue Date: 2023-01-01\nRenewal Date: 2024-01-01",
+                    "Issue Date: 2023-01-01; Renewal Date: 2024-01-01"]),
+        f"Policy Number: POL{rng.randint(0, 999999):06d}",
+        "Total Coverage Amount: repeated, the first one counts",
+    ]
+    return "\n" + "\n".join(lines)
+
+
+def load_responses(directory):
+    responses = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            responses.append(f.read())
+    return responses
+
+
+def measure(fn, responses):
+    started = time.perf_counter()
+    for text in responses:
+        fn(text)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--responses', help='directory of saved completion texts')
+    parser.add_argument('--count', type=int, default=10000, help='synthetic responses to generate')
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--name-pool', type=int, default=1000,
+                        help='distinct category names across the synthetic responses')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    metrics.registry.enabled = False
+    if args.responses:
+        responses = load_responses(args.responses)
+    else:
+        rng = random.Random(args.seed)
+        responses = [synthetic_response(rng, args.categories, name_pool=args.name_pool) for _ in range(args.count)]
+
+    mismatches = sum(legacy_parse(text) != parse(text) for text in responses)
+    legacy_seconds = measure(legacy_parse, responses)
+    seconds = measure(parse, responses)
+    print(f"responses:        {len(responses)}")
+    print(f"legacy parser:    {len(responses) / legacy_seconds:,.0f} responses/s")
+    print(f"single pass:      {len(responses) / seconds:,.0f} responses/s")
+    print(f"speedup:          {legacy_seconds / seconds:.1f}x")
+    print(f"differing output: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Cold start: time from a fresh interpreter to the first response.
+
+    python -m benchmarks.bench_startup --repeat 5
+
+Every measurement runs in a new Python process started from the repository
+root, so nothing is reused through sys.modules. For each target the child
+times its own work after the interpreter is up; the wall column adds
+interpreter startup and exit as seen from here.
+
+  viz import / viz first response  import viz, then GET /jobs/stats through
+                                   the Flask test client
+  app import / app first render    import app, then one run of app.py through
+                                   streamlit's AppTest, as for a new session
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (setup, timed code); setup is excluded from the child's own timing
+TARGETS = {
+    'python': ('', 'pass'),
+    'viz import': ('', 'import viz'),
+    'viz first response': ('', 'import viz\nassert viz.app.test_client().get("/jobs/stats").status_code == 200'),
+    'app import': ('', 'import app'),
+    'app first render': ('from streamlit.testing.v1 import AppTest',
+                         'at = AppTest.from_file("app.py").run(timeout=120)\nassert not at.exception, at.exception'),
+}
+
+CHILD = '''
+import json, sys, time
+{setup}
+started = time.perf_counter()
+{code}
+print(json.dumps(time.perf_counter() - started))
+'''
+
+
+def run_once(name):
+    setup, code = TARGETS[name]
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD.format(setup=setup, code=code)],
+                            cwd=REPO_ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed')
+    return json.loads(result.stdout.strip().splitlines()[-1]), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    args = parser.parse_args()
+
+    for name in args.targets:
+        try:
+            runs = [run_once(name) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{name:20} error: {e}")
+            continue
+        own = [seconds for seconds, _ in runs]
+        wall = [seconds for _, seconds in runs]
+        print(f"{name:20} median {statistics.median(own):7.3f}s  min {min(own):7.3f}s  "
+              f"wall {statistics.median(wall):7.3f}s")
+
+
+if __name__ == '__main__':
+    main()
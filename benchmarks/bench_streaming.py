@@ -0,0 +1,104 @@
+"""Time to first token with and without streaming, against the local fake model server.
+
+    python -m benchmarks.bench_streaming --latency 0.3 --token-delay 0.02 --answer-tokens 80
+
+Chat: a ConversationalRetrievalChain over a small FAISS store with the
+completions LLM the app uses for LLM_PROVIDER=openai, asked a question and a
+follow-up (which adds the condense-question call), with the app's
+StreamingAnswerHandler attached. Extraction: policy_extraction.query_openai_and_parse over
+a synthetic policy split into segments, with and without on_text. Without
+streaming the first text a user sees is the whole answer, so its time to
+first token is the total time.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.fake_llm_server import start_server
+
+QUESTIONS = ['What does the policy cover?', 'And what is excluded from it?']
+
+
+def synthetic_policy(segments):
+    fields = ['Total Coverage Amount: $500,000', 'Type of Insurance: Health', 'Annual Premium: $1,200',
+              'Name of the Insurer: Example Mutual', 'Policy Number: HX-12345']
+    filler = 'The insured person must notify the insurer within thirty days of any claim. ' * 35
+    return '\n\n'.join(fields[i % len(fields)] + '\n' + filler for i in range(segments))
+
+
+def bench_chat(server, streaming, runs):
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain.llms import OpenAI
+    from langchain.memory import ConversationBufferMemory
+    from langchain.vectorstores import FAISS
+    from chat_streaming import StreamingAnswerHandler
+    from embedding_store import HashEmbeddings
+
+    store = FAISS.from_texts([f'Clause {i}: cover for treatment {i}' for i in range(50)], HashEmbeddings())
+    llm = OpenAI(model_name='gpt-3.5-turbo-instruct', streaming=streaming, openai_api_key='fake',
+                 openai_api_base=server.url)
+    first, total, updates = [], [], []
+    for _ in range(runs):
+        memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True, output_key='answer')
+        chain = ConversationalRetrievalChain.from_llm(llm=llm, retriever=store.as_retriever(), memory=memory)
+        for question in QUESTIONS:
+            stream = StreamingAnswerHandler(lambda text: None)
+            started = time.perf_counter()
+            chain({'question': question}, callbacks=[stream])
+            elapsed = time.perf_counter() - started
+            first.append(stream.first_token_seconds if stream.first_token_seconds is not None else elapsed)
+            total.append(elapsed)
+            updates.append(stream.updates)
+    return first, total, updates
+
+
+def bench_extraction(policy_extraction, text, streaming, runs):
+    first, total = [], []
+    for _ in range(runs):
+        seen = []
+        started = time.perf_counter()
+
+        def on_text(segment, delta):
+            if not seen:
+                seen.append(time.perf_counter() - started)
+        policy_extraction.query_openai_and_parse(text, on_text=on_text if streaming else None)
+        elapsed = time.perf_counter() - started
+        first.append(seen[0] if seen else elapsed)
+        total.append(elapsed)
+    return first, total
+
+
+def report(name, first, total, updates=None):
+    line = (f"{name:26} first token {statistics.mean(first):6.3f}s  "
+            f"complete {statistics.mean(total):6.3f}s")
+    if updates is not None:
+        line += f"  {statistics.mean(updates):5.1f} screen updates"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.3, help='fake server delay before the first token')
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    parser.add_argument('--answer-tokens', type=int, default=80)
+    parser.add_argument('--segments', type=int, default=4, help='segments of the synthetic policy')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, token_delay=args.token_delay, answer_tokens=args.answer_tokens)
+    for streaming in (False, True):
+        report(f"chat {'streamed' if streaming else 'blocking'}", *bench_chat(server, streaming, args.runs))
+
+    # read at import time, the fake server accepts any key
+    os.environ.setdefault('OPENAI_API_KEY', 'fake')
+    import policy_extraction
+    policy_extraction.get_openai().api_base = server.url
+    text = synthetic_policy(args.segments)
+    for streaming in (False, True):
+        report(f"extraction {'streamed' if streaming else 'blocking'}",
+               *bench_extraction(policy_extraction, text, streaming, args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Sunburst tree building: shared SunburstTree builders against the old list scans.
+
+    python -m benchmarks.bench_sunburst --nodes 100000 --legacy-nodes 20000
+
+The old builders look parents up with labels.index() and check for existing
+nodes with `in labels`, so they are only run at --legacy-nodes (quadratic
+time), where the output of both versions is also compared.
+"""
+import argparse
+import time
+
+import sunburst
+import visu
+from benchmarks.fixtures import synthetic_policy, synthetic_rows
+
+
+def legacy_policy_lists(policy_info):
+    # sunburst.generate_sunburst_chart before SunburstTree
+    labels, parents, values, hovertext = [], [], [], []
+    root_label = f"Total Coverage: {policy_info.total_coverage_amount or 'Not specified'}"
+    labels.append(root_label)
+    parents.append("")
+    values.append(0)
+    hovertext.append(f"Insurer: {policy_info.insurer or 'Not specified'}<br>"
+                     f"Insured: {', '.join(policy_info.insured) or 'Not specified'}<br>"
+                     f"Total Coverage Amount: {policy_info.total_coverage_amount or 'Not specified'}<br>"
+                     f"Annual Premium: {policy_info.annual_premium or 'Not specified'}<br>"
+                     f"Renewal Date: {policy_info.renewal_date or 'Not specified'}<br>"
+                     f"Issue Date: {policy_info.issue_date or 'Not specified'}")
+    for insurance_type in policy_info.insurance_types:
+        type_label = insurance_type
+        labels.append(type_label)
+        parents.append(root_label)
+        values.append(0)
+        hovertext.append(f"Type of Insurance: {insurance_type}")
+        for category, details in policy_info.categories.get(insurance_type, {}).items():
+            category_label = f"{type_label}: {category}"
+            labels.append(category_label)
+            parents.append(type_label)
+            values.append(0)
+            hovertext.append(f"Category: {category}")
+            for item in details.get('covered', []):
+                labels.append(f"Covered: {item}")
+                parents.append(category_label)
+                values.append(1)
+                hovertext.append(f"Covered Item: {item}")
+            for item in details.get('not_covered', []):
+                labels.append(f"Not Covered: {item}")
+                parents.append(category_label)
+                values.append(1)
+                hovertext.append(f"Not Covered Item: {item}")
+    for i in range(len(labels) - 1, -1, -1):
+        parent_index = labels.index(parents[i]) if parents[i] else -1
+        if parent_index != -1:
+            values[parent_index] += values[i]
+    return labels, parents, values, hovertext
+
+
+def legacy_db_lists(data):
+    # visu.generate_sunburst_chart_from_db before SunburstTree, colors left out
+    total_coverage_amount = data[0][1] if data else "Not specified"
+    labels = ['Total Coverage: ' + total_coverage_amount]
+    parents, values, hovertext = [''], [0], [visu.generate_hovertext_for_root(data)]
+    for row in data:
+        _, _, type_of_insurance, _, _, _, _, _, _, category_name, covered, not_covered = row
+        type_label = type_of_insurance + " Insurance"
+        if type_label not in labels:
+            labels.append(type_label)
+            parents.append('Total Coverage: ' + total_coverage_amount)
+            values.append(0)
+            hovertext.append(type_label)
+        category_label = f"{type_label}: {category_name}"
+        if category_label not in labels:
+            labels.append(category_label)
+            parents.append(type_label)
+            values.append(0)
+            hovertext.append(category_label)
+        for item in (covered + ',' + not_covered).split(','):
+            if item.strip():
+                item_label = f"{category_label}: {'Covered' if item in covered else 'Not Covered'} - {item.strip()}"
+                labels.append(item_label)
+                parents.append(category_label)
+                values.append(1)
+                hovertext.append(item_label)
+    for i in range(len(labels) - 1, 0, -1):
+        parent_index = labels.index(parents[i])
+        values[parent_index] += values[i]
+    return labels, parents, values, hovertext
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def tree_lists(tree):
+    return tree.labels, tree.parents, tree.values, tree.hovertext
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--legacy-nodes', type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = [
+        ('sunburst.py', synthetic_policy, sunburst.build_sunburst_tree, legacy_policy_lists),
+        ('visu.py', synthetic_rows, visu.build_sunburst_tree_from_db, legacy_db_lists),
+    ]
+    for name, make_input, build, legacy in cases:
+        small = make_input(args.legacy_nodes)
+        tree, seconds = timed(build, small)
+        legacy_lists, legacy_seconds = timed(legacy, small)
+        identical = tree_lists(tree) == legacy_lists
+        large_tree, large_seconds = timed(build, make_input(args.nodes))
+        print(f"{name:12} {len(tree):>7} nodes: legacy {legacy_seconds:8.3f}s  tree {seconds:8.3f}s  "
+              f"identical={identical}")
+        print(f"{name:12} {len(large_tree):>7} nodes: tree {large_seconds:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
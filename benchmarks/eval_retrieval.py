@@ -0,0 +1,130 @@
+"""Retrieval recall and latency: dense FAISS, BM25, hybrid and hybrid + rerank.
+
+    python -m benchmarks.eval_retrieval --policies 40 --k 3
+    python -m benchmarks.eval_retrieval --embeddings openai   # needs OPENAI_API_KEY
+
+The fixture corpus is generated from a fixed seed: policies with numbered
+clauses, named exclusions and policy numbers, chunked with the app's
+settings and indexed through DocumentIndex, so the FAISS store and the BM25
+index are built exactly as in app.py. Every question has one known answer
+chunk (the chunk holding its clause). Reported per retriever: recall@k (the
+answer chunk is among the k chunks sent to the LLM), MRR, mean latency and
+the mean characters of context retrieved.
+
+The default hash embeddings are a deterministic offline stand-in and much
+weaker than a real embedding model, so compare the dense numbers with
+--embeddings openai before drawing conclusions about them.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import chunking
+from document_index import DocumentIndex
+from embedding_store import HashEmbeddings
+from hybrid_retriever import HybridRetriever, TermOverlapReranker
+
+CHUNK_SEPARATOR = "\n"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+TOPICS = {
+    'hospital stays': 'inpatient admission room and board nursing care in a hospital ward',
+    'surgery': 'surgical procedures operating theatre fees surgeon and anaesthetist charges',
+    'maternity': 'pregnancy childbirth prenatal and postnatal care for the mother and newborn',
+    'dental': 'treatment of teeth fillings extractions and dental check ups',
+    'vision': 'eye examinations spectacles contact lenses and optometry',
+    'ambulance': 'emergency transport by road or air ambulance to the nearest hospital',
+    'prescriptions': 'prescribed medicines drugs dispensed by a licensed pharmacy',
+    'physiotherapy': 'rehabilitation sessions with a registered physiotherapist after injury',
+    'mental health': 'psychiatric treatment counselling and therapy sessions',
+    'travel': 'medical expenses incurred while travelling abroad on a trip',
+}
+EXCLUSIONS = ['cosmetic surgery', 'experimental treatment', 'self inflicted injury', 'war and terrorism',
+              'pre existing conditions', 'hazardous sports', 'fertility treatment', 'weight loss surgery']
+FILLER = ('the insured person must notify the insurer within thirty days and provide all supporting documents '
+          'requested including invoices receipts and medical reports signed by the treating practitioner').split()
+
+
+def make_corpus(policies, seed=7):
+    # [(source, pages)] and questions [(question, marker)], where marker is a
+    # string that only occurs in the chunk answering the question
+    rng = random.Random(seed)
+    documents, questions = [], []
+    for p in range(policies):
+        policy_number = f"HX-{rng.randint(10000, 99999)}"
+        source = f"policy_{p}.pdf"
+        lines = [f"Policy Number: {policy_number}", f"Insurer: Insurer {p % 7}", ""]
+        for section, topic in enumerate(rng.sample(list(TOPICS), 6), start=1):
+            limit = rng.randint(1, 90) * 1000
+            exclusion = rng.choice(EXCLUSIONS)
+            clause = f"{p + 1}.{section}.{rng.randint(1, 9)}"
+            marker = f"Clause {clause}"
+            lines.append(f"{marker}: {topic.title()}. This section covers {TOPICS[topic]} up to a limit of "
+                         f"{limit} per year under policy {policy_number}. Exclusion: {exclusion} is not covered "
+                         f"under this clause. " + ' '.join(rng.choice(FILLER) for _ in range(90)))
+            lines.append("")
+            questions.append((f"What does clause {clause} say?", marker))
+            questions.append((f"What is the limit for {topic} in clause {clause}?", marker))
+            questions.append((f"Under policy {policy_number}, is {exclusion} covered for {topic}?", marker))
+            questions.append((f"How much is paid for {TOPICS[topic]} on policy {policy_number}?", marker))
+        documents.append((source, [(1, '\n'.join(lines))]))
+    return documents, questions
+
+
+def build_index(documents, embedder):
+    document_index = DocumentIndex(embedder)
+    for source, pages in documents:
+        document_index.add_document(source, chunking.iter_chunks([(source, pages)], CHUNK_SEPARATOR,
+                                                                 CHUNK_SIZE, CHUNK_OVERLAP))
+    return document_index
+
+
+def evaluate(name, retrieve, questions, k):
+    hits, reciprocal_ranks, latencies, context = 0, [], [], []
+    for question, marker in questions:
+        started = time.perf_counter()
+        docs = retrieve(question)[:k]
+        latencies.append(time.perf_counter() - started)
+        context.append(sum(len(doc.page_content) for doc in docs))
+        rank = next((i for i, doc in enumerate(docs, start=1) if marker in doc.page_content), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    print(f"{name:16} recall@{k} {hits / len(questions):6.3f}  MRR {statistics.mean(reciprocal_ranks):6.3f}  "
+          f"{statistics.mean(latencies) * 1000:7.2f} ms/query  {statistics.mean(context):7.0f} chars")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--policies', type=int, default=40)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--embeddings', choices=['hash', 'openai'], default='hash')
+    args = parser.parse_args()
+
+    if args.embeddings == 'openai':
+        from langchain.embeddings import OpenAIEmbeddings
+        embedder = OpenAIEmbeddings(model="text-embedding-ada-002")
+    else:
+        embedder = HashEmbeddings(1024)
+    documents, questions = make_corpus(args.policies)
+    started = time.perf_counter()
+    document_index = build_index(documents, embedder)
+    print(f"{len(document_index.keyword_index)} chunks, {len(questions)} questions, "
+          f"indexed in {time.perf_counter() - started:.1f}s")
+
+    vectorstore = document_index.vectorstore
+    keyword_index = document_index.keyword_index
+    hybrid = HybridRetriever(vectorstore=vectorstore, keyword_index=keyword_index, k=args.k)
+    reranked = HybridRetriever(vectorstore=vectorstore, keyword_index=keyword_index, k=args.k,
+                               reranker=TermOverlapReranker())
+    evaluate('dense k=4', lambda q: vectorstore.similarity_search(q, k=4), questions, 4)
+    evaluate('dense', lambda q: vectorstore.similarity_search(q, k=args.k), questions, args.k)
+    evaluate('bm25', lambda q: [vectorstore.docstore.search(i) for i, _ in keyword_index.search(q, args.k)],
+             questions, args.k)
+    evaluate('hybrid', hybrid.get_relevant_documents, questions, args.k)
+    evaluate('hybrid + rerank', reranked.get_relevant_documents, questions, args.k)
+
+
+if __name__ == '__main__':
+    main()
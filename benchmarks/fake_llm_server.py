@@ -0,0 +1,142 @@
+"""Local stand-in for the OpenAI completions API.
+
+Answers POST /v1/completions by echoing back every "Key: value" line of the
+policy text found in the prompt, which is what a perfect extractor would
+return, so segmenting and merging can be checked without network access.
+Requests with "stream": true get the completion as server-sent events, one
+token per event, --token-delay seconds apart, after the initial --latency.
+Prompts without policy fields get a fixed answer of --answer-tokens words.
+
+    python -m benchmarks.fake_llm_server --port 8765 --latency 0.5 --token-delay 0.02
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1 python viz.py
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIELD_PATTERN = re.compile(
+    r'^\s*((?:Total Coverage Amount|Type of Insurance|Categories of Insurance Covered|'
+    r'Details of What is (?:Not )?Covered under [^:\n]+|Covered Events|Annual Premium|'
+    r'Name of the Insurer|Name of the Insured|Issue Date|Renewal Date|Policy Number)'
+    r': [^\n]+)$', re.MULTILINE)
+
+
+TOKEN_PATTERN = re.compile(r'\s*\S+')
+
+
+def fake_completion(prompt, answer_tokens=60):
+    fields = [match.group(1).strip() for match in FIELD_PATTERN.finditer(prompt)]
+    if not fields:
+        # chat questions: a deterministic answer of the requested length
+        return ' ' + ' '.join(f'word{i}' for i in range(answer_tokens))
+    return '\n' + '\n'.join(fields)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, rate_limit_every=0, token_delay=0.0, answer_tokens=60):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.token_delay = token_delay
+        self.answer_tokens = answer_tokens
+        self.requests = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            number = next(self.server.requests)
+        if self.server.rate_limit_every and number % self.server.rate_limit_every == 0:
+            self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                            {'Retry-After': '0'})
+            return
+
+        time.sleep(self.server.latency)
+        prompt = body.get('prompt', '')
+        if isinstance(prompt, list):
+            prompt = prompt[0] if prompt else ''
+        text = fake_completion(prompt, self.server.answer_tokens)
+        if body.get('stream'):
+            self._send_stream(number, body.get('model', 'fake'), text)
+            return
+        # generating takes as long as streaming, the client just sees none of it
+        time.sleep(self.server.token_delay * max(0, len(TOKEN_PATTERN.findall(text)) - 1))
+        self._send_json(200, {
+            'id': f'cmpl-fake-{number}',
+            'object': 'text_completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'text': text, 'index': 0, 'logprobs': None, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': len(prompt.split()),
+                      'completion_tokens': len(text.split()),
+                      'total_tokens': len(prompt.split()) + len(text.split())},
+        })
+
+    def _send_stream(self, number, model, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        tokens = TOKEN_PATTERN.findall(text)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.server.token_delay)
+            chunk = {'id': f'cmpl-fake-{number}', 'object': 'text_completion', 'created': int(time.time()),
+                     'model': model, 'choices': [{'text': token, 'index': 0, 'logprobs': None,
+                                                  'finish_reason': 'stop' if i == len(tokens) - 1 else None}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(port=0, latency=0.0, rate_limit_every=0, token_delay=0.0, answer_tokens=60):
+    # Serves on a background thread, port 0 picks a free port
+    server = FakeLLMServer(('127.0.0.1', port), latency, rate_limit_every, token_delay, answer_tokens)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='answer every Nth request with 429 to exercise retries')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='seconds between streamed tokens')
+    parser.add_argument('--answer-tokens', type=int, default=60,
+                        help='length of the answer to prompts without policy fields')
+    args = parser.parse_args()
+    server = FakeLLMServer(('127.0.0.1', args.port), args.latency, args.rate_limit_every, args.token_delay,
+                           args.answer_tokens)
+    print(f'Fake completions API on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
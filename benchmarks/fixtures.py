@@ -0,0 +1,76 @@
+"""Synthetic policies shared by the benchmarks.
+
+SyntheticPolicy stands in for a parsed policy_extraction.InsurancePolicyInfo.
+With by_type=False its categories are flat, the way db.insert_policy stores
+them; with by_type=True they are nested under each insurance type, the way
+sunburst.generate_sunburst_chart and viz.generate_sunburst_chart read them.
+synthetic_rows gives the joined database rows visu.py charts, and populate
+fills a database with policies through db.insert_policy.
+"""
+import db
+import migrations
+
+TYPES = ['Life', 'Health', 'Auto', 'Home']
+
+
+def category_details(prefix, categories, items, exclusions):
+    return {
+        f"Category {c}": {
+            "covered": [f"Item {prefix}.{c}.{i}" for i in range(items)],
+            "not_covered": [f"Exclusion {prefix}.{c}.{i}" for i in range(exclusions)],
+            "events_covered": [],
+        }
+        for c in range(categories)
+    }
+
+
+class SyntheticPolicy:
+    def __init__(self, n=0, categories=8, items=10, exclusions=None, types=1, by_type=False):
+        exclusions = items // 2 if exclusions is None else exclusions
+        self.total_coverage_amount = f"{100 + n % 900},000"
+        self.annual_premium = f"{1 + n % 50},000"
+        self.insurer = "Acme Insurance"
+        self.insured = [f"Customer {n}"]
+        self.issue_date = "2023-01-01"
+        self.renewal_date = "2024-01-01"
+        self.policy_number = f"POL{n}"
+        if by_type:
+            self.insurance_types = [f"Type {t}" for t in range(types)]
+            self.categories = {
+                insurance_type: category_details(t, categories, items, exclusions)
+                for t, insurance_type in enumerate(self.insurance_types)
+            }
+        else:
+            self.insurance_types = [TYPES[n % len(TYPES)]]
+            self.categories = category_details(n, categories, items, exclusions)
+
+
+def categories_for(nodes, types, items):
+    # every category contributes itself plus 2 * items leaves
+    return max(1, nodes // (types * (2 * items + 1)))
+
+
+def synthetic_policy(nodes, types=10, items=10):
+    # a policy whose sunburst tree has about nodes nodes
+    return SyntheticPolicy(categories=categories_for(nodes, types, items), items=items, exclusions=items,
+                           types=types, by_type=True)
+
+
+def synthetic_rows(nodes, types=10, items=10):
+    rows = []
+    categories = categories_for(nodes, types, items)
+    for t in range(types):
+        for c in range(categories):
+            covered = ", ".join(f"Item {t}.{c}.{i}" for i in range(items))
+            not_covered = ", ".join(f"Exclusion {t}.{c}.{i}" for i in range(items))
+            rows.append((t + 1, "100,000", f"Type {t}", "10,000", "Acme Insurance", "John Doe, Jane Doe",
+                         "2023-01-01", "2024-01-01", f"POL{t}", f"Category {c}", covered, not_covered))
+    return rows
+
+
+def populate(db_path, policies, categories, items):
+    conn = db.get_connection(db_path)
+    migrations.migrate(conn)
+    with db.transaction(db_path) as conn:
+        for n in range(policies):
+            db.insert_policy(conn, SyntheticPolicy(n, categories, items))
@@ -0,0 +1,201 @@
+"""End-to-end benchmark suite: every pipeline stage and both user flows, offline.
+
+    python -m benchmarks.run_suite --pdfs 8 --pages 12 --policies 2000 --output baseline.json
+    python -m benchmarks.run_suite --output new.json --compare baseline.json
+
+Generates synthetic policy PDFs (benchmarks.synthetic_pdfs) and a policy
+database in a temporary directory, uses HashEmbeddings for embeddings and
+the local fake model server for every LLM call, then times:
+
+  stages  extract_pymupdf    policy_extraction.extract_text_from_pdf, every PDF
+          extract_pypdf2     app.get_pdf_text, every PDF
+          chunk              app.get_text_chunks over all extracted text
+          embed_index        app.get_vector_store over those chunks
+          parse_response     policy_extraction.parse_openai_response, one completion per PDF
+          insert_policy      policy_extraction.insert_data_into_database, one policy per PDF
+          sunburst_policy    sunburst.generate_sunburst_chart, --nodes nodes
+          sunburst_upload    viz.generate_sunburst_chart, --nodes nodes
+          sunburst_db        visu aggregated chart over --policies policies
+  flows   upload_to_chart    viz.process_upload of one PDF, extraction cache bypassed
+          question_to_answer app's retrieval chain: a question and a follow-up
+
+Each case runs --repeat times. Median, min and max seconds go to --output
+as JSON along with the parameters and environment. --compare prints the
+change against an earlier result file and exits with status 1 when any
+case got slower by more than --threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synthetic_pdfs
+from benchmarks.fake_llm_server import fake_completion, start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# changes smaller than this are timer noise whatever the percentage
+MIN_CHANGE_SECONDS = 0.001
+QUESTIONS = ['What is the total coverage amount?', 'And what is not covered under it?']
+
+
+class Upload(io.BytesIO):
+    # what st.file_uploader hands to app.py
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        # the modules print progress for every document
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - started)
+    return {'median': statistics.median(runs), 'min': min(runs), 'max': max(runs), 'runs': runs}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'commit': commit}
+
+
+def run_suite(args, tmp):
+    # settings are read at import time, so they are set before the app modules load
+    server = start_server(latency=args.llm_latency)
+    os.environ.update({
+        'INSURANCE_DB': os.path.join(tmp, 'insurance.db'),
+        'EMBEDDING_CACHE_PATH': os.path.join(tmp, 'embeddings.db'),
+        'INDEX_CACHE_DIR': os.path.join(tmp, 'index_cache'),
+        'OPENAI_API_BASE': server.url,
+        'OPENAI_API_KEY': 'offline',
+        'open_api_key': 'offline',
+        'LLM_PROVIDER': 'openai',
+        'ANSWER_CACHE_SIZE': '0',
+    })
+    import app
+    import db
+    import jobs
+    import policy_extraction
+    import sunburst
+    import visu
+    import viz
+    from benchmarks.fixtures import populate, synthetic_policy
+    from embedding_store import HashEmbeddings
+
+    policy_extraction.get_openai().api_base = server.url
+    paths = synthetic_pdfs.make_pdfs(os.path.join(tmp, 'pdfs'), args.pdfs, args.pages, args.seed)
+    uploads = [Upload(path) for path in paths]
+    with contextlib.redirect_stdout(io.StringIO()):
+        policy_extraction.setup_database()
+        texts = [policy_extraction.extract_text_from_pdf(path) for path in paths]
+        completions = [fake_completion(policy_extraction.EXTRACTION_PROMPT + text) for text in texts]
+        policies = [policy_extraction.parse_openai_response(completion) for completion in completions]
+    chunks = app.get_text_chunks(''.join(texts))
+    embedder = HashEmbeddings()
+    vectorstore = app.get_vector_store(chunks, embedder)
+    db_path = os.path.join(tmp, 'chart.db')
+    populate(db_path, args.policies, categories=8, items=10)
+    upload_policy = synthetic_policy(args.nodes, types=1)
+    chart_policy = synthetic_policy(args.nodes)
+    job_queue = jobs.JobQueue(workers=1)
+
+    def ask():
+        conversation = app.get_conversation_chain(None, app.get_retriever(vectorstore))
+        for question in QUESTIONS:
+            conversation({'question': question})
+
+    cases = {
+        'extract_pymupdf': lambda: [policy_extraction.extract_text_from_pdf(path) for path in paths],
+        'extract_pypdf2': lambda: app.get_pdf_text(uploads),
+        'chunk': lambda: app.get_text_chunks(''.join(texts)),
+        'embed_index': lambda: app.get_vector_store(chunks, embedder),
+        'parse_response': lambda: [policy_extraction.parse_openai_response(completion) for completion in completions],
+        'insert_policy': lambda: [policy_extraction.insert_data_into_database(policy) for policy in policies],
+        'sunburst_policy': lambda: sunburst.generate_sunburst_chart(chart_policy),
+        'sunburst_upload': lambda: viz.generate_sunburst_chart(upload_policy),
+        'sunburst_db': lambda: visu.generate_sunburst_chart_from_aggregates(*visu.fetch_aggregates_from_db(db_path)),
+        'upload_to_chart': lambda: viz.process_upload(jobs.Job(job_queue), paths[0], refresh=True),
+        'question_to_answer': ask,
+    }
+    results = {}
+    for name, fn in cases.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = timed(fn, args.repeat)
+        print(f"{name:20} median {results[name]['median'] * 1000:10.2f} ms  "
+              f"min {results[name]['min'] * 1000:10.2f} ms  max {results[name]['max'] * 1000:10.2f} ms")
+    job_queue.shutdown()
+    db.close_connections()
+    server.shutdown()
+    return results
+
+
+def compare(results, baseline, threshold):
+    # True when a case present in both got slower than the threshold allows
+    regressed = False
+    print(f"\n{'case':20} {'baseline ms':>12} {'now ms':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median']
+        change = result['median'] / before - 1 if before else 0.0
+        flag = ''
+        if abs(result['median'] - before) < MIN_CHANGE_SECONDS:
+            pass
+        elif change > threshold:
+            flag = '  slower'
+            regressed = True
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"{name:20} {before * 1000:12.2f} {result['median'] * 1000:12.2f} {change:+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pdfs', type=int, default=8)
+    parser.add_argument('--pages', type=int, default=12)
+    parser.add_argument('--policies', type=int, default=2000, help='rows in the chart database')
+    parser.add_argument('--nodes', type=int, default=5000, help='nodes of the single policy sunburst charts')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='fake model server delay per call')
+    parser.add_argument('--only', nargs='+', help='run only these cases')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier --output file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown counted as a regression')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_suite(args, tmp)
+    report = {'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+              'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['params'] != report['params']:
+            print('Warning: the baseline was run with different parameters')
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Synthetic insurance policy PDFs for benchmarks.
+
+    python -m benchmarks.synthetic_pdfs out/ --count 20 --pages 8
+
+Each policy opens with the summary lines the fake model server echoes back
+("Policy Number: ...", "Details of What is Covered under ...: ..."), so the
+upload pipeline runs offline with a known extraction result, followed by
+pages of numbered clauses. The same seed and arguments give the same files.
+"""
+import argparse
+import os
+import random
+import textwrap
+
+TYPES = ['Health', 'Life', 'Auto', 'Home', 'Travel']
+CATEGORIES = ['Hospital Care', 'Surgery', 'Maternity', 'Dental', 'Vision', 'Ambulance', 'Prescriptions',
+              'Physiotherapy', 'Collision', 'Theft', 'Fire', 'Flood', 'Baggage', 'Cancellation']
+ITEMS = ['room and board', 'nursing', 'specialist fees', 'diagnostics', 'day surgery', 'implants',
+         'emergency transport', 'generic drugs', 'glasses', 'fillings', 'repairs', 'replacement',
+         'temporary housing', 'lost luggage', 'rebooking']
+EXCLUSIONS = ['cosmetic treatment', 'pre existing conditions', 'wear and tear', 'war', 'hazardous sports',
+              'experimental treatment', 'intentional damage']
+WORDS = ('the insured person must notify the insurer within thirty days of any event that may give rise '
+         'to a claim and provide invoices receipts reports and any other documents reasonably requested '
+         'by the claims department before payment is made under this section').split()
+LINE_WIDTH = 95
+LINES_PER_PAGE = 60
+
+
+def policy_summary(rng, n):
+    # "Key: value" lines in the format the extraction prompt asks for
+    types = rng.sample(TYPES, rng.randint(1, 2))
+    categories = rng.sample(CATEGORIES, rng.randint(2, 5))
+    lines = [
+        f"Policy Number: POL-{n:06d}",
+        f"Name of the Insurer: Insurer {rng.randint(1, 40)}",
+        f"Name of the Insured: Customer {n} and Partner {n}",
+        f"Type of Insurance: {', '.join(types)}",
+        f"Total Coverage Amount: ${rng.randint(10, 900) * 1000:,}",
+        f"Annual Premium: ${rng.randint(2, 90) * 50:,}",
+        f"Issue Date: 2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        f"Renewal Date: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        f"Categories of Insurance Covered: {', '.join(categories)}",
+    ]
+    for category in categories:
+        lines.append(f"Details of What is Covered under {category}: {', '.join(rng.sample(ITEMS, 3))}")
+        lines.append(f"Details of What is Not Covered under {category}: {', '.join(rng.sample(EXCLUSIONS, 2))}")
+    lines.append(f"Covered Events: {', '.join(rng.sample(ITEMS, 2))}")
+    return lines
+
+
+def policy_pages(n, pages, seed=0):
+    # Text of each page of policy n
+    rng = random.Random(seed * 1000003 + n)
+    lines = policy_summary(rng, n) + ['']
+    clause = 0
+    while len(lines) < pages * LINES_PER_PAGE:
+        clause += 1
+        body = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+        lines.extend(textwrap.wrap(f"Clause {clause}. {body}.", LINE_WIDTH) + [''])
+    return ['\n'.join(lines[i:i + LINES_PER_PAGE]) for i in range(0, pages * LINES_PER_PAGE, LINES_PER_PAGE)]
+
+
+def write_pdf(path, pages):
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_text((40, 40), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_pdfs(directory, count, pages, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    return [write_pdf(os.path.join(directory, f"policy_{n:05d}.pdf"), policy_pages(n, pages, seed))
+            for n in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = make_pdfs(args.directory, args.count, args.pages, args.seed)
+    print(f"Wrote {len(paths)} PDFs of {args.pages} pages to {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
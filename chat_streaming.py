@@ -0,0 +1,57 @@
+import os
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+import metrics
+
+# Passes the answer to a display function while the LLM is still writing it.
+# Once there is chat history the chain first asks the LLM to condense the
+# follow-up question, so only tokens after the retriever has run (the answer)
+# are shown. Updates are throttled, each one is a message to the browser.
+STREAM_INTERVAL = float(os.getenv('STREAM_INTERVAL', '0.05'))
+
+
+class StreamingAnswerHandler(BaseCallbackHandler):
+    def __init__(self, display, interval=STREAM_INTERVAL):
+        self.display = display
+        self.interval = interval
+        self.text = ''
+        self.updates = 0
+        self.started = time.perf_counter()
+        self.first_token_seconds = None  # from the question to the first answer token
+        self._answering = False
+        self._shown_at = 0.0
+        self._call_tokens = 0
+
+    def on_retriever_end(self, documents, **kwargs):
+        self._answering = True
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.text = ''
+        self._call_tokens = 0
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._call_tokens += 1
+        if not self._answering:
+            return
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+        self.text += token
+        now = time.perf_counter()
+        if now - self._shown_at >= self.interval:
+            self._shown_at = now
+            self._show()
+
+    def on_llm_end(self, response, **kwargs):
+        # streamed calls report no usage, each token arrived as one callback
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        metrics.inc('llm_tokens_total', usage.get('prompt_tokens', 0), kind='prompt', source='chat')
+        metrics.inc('llm_tokens_total', usage.get('completion_tokens', self._call_tokens), kind='completion',
+                    source='chat')
+        if self._answering and self.text:
+            self._show()
+
+    def _show(self):
+        self.updates += 1
+        self.display(self.text)
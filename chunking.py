@@ -0,0 +1,104 @@
+import re
+from collections import deque
+
+# Streaming counterpart of langchain's CharacterTextSplitter: pages are consumed
+# as they are extracted and chunks are yielded with the source file, page and
+# character offset they start at, so only about one chunk plus one page of text
+# is held at a time.
+
+
+class Chunk:
+    def __init__(self, text, source, page, offset):
+        self.text = text
+        self.source = source
+        self.page = page
+        self.offset = offset  # character offset from the start of the source
+
+    @property
+    def metadata(self):
+        return {'source': self.source, 'page': self.page, 'offset': self.offset}
+
+
+def _iter_pieces(pages, separator):
+    # Split on the separator across page boundaries. Each non-empty piece is
+    # yielded with its offset and the (offset, page) points where it starts or
+    # crosses into a new page.
+    pattern = re.compile(re.escape(separator)) if separator else None
+    pending, pending_offset, pending_breaks = '', 0, []
+    offset = 0
+    for page, text in pages:
+        if not text:
+            continue
+        if pattern is None:
+            for i, char in enumerate(text):
+                yield char, offset + i, [(offset + i, page)]
+            offset += len(text)
+            continue
+
+        start = 0
+        for match in pattern.finditer(text):
+            piece = text[start:match.start()]
+            if pending:
+                breaks = pending_breaks + [(offset, page)] if piece else pending_breaks
+                piece, piece_offset = pending + piece, pending_offset
+                pending, pending_breaks = '', []
+            else:
+                piece_offset, breaks = offset + start, [(offset + start, page)]
+            if piece:
+                yield piece, piece_offset, breaks
+            start = match.end()
+
+        tail = text[start:]
+        if tail:
+            if not pending:
+                pending_offset = offset + start
+            pending += tail
+            pending_breaks.append((offset + start, page))
+        offset += len(text)
+
+    if pending:
+        yield pending, pending_offset, pending_breaks
+
+
+def iter_chunks(documents, separator='\n', chunk_size=1000, chunk_overlap=200):
+    # documents is an iterable of (source, pages), pages an iterable of
+    # (page_number, text) such as pdf_extract.iter_pages produces
+    separator_len = len(separator)
+    for source, pages in documents:
+        current = deque()
+        total = 0
+        for piece, offset, breaks in _iter_pieces(pages, separator):
+            length = len(piece)
+            if total + length + (separator_len if current else 0) > chunk_size:
+                if current:
+                    chunk = _join(current, separator, source)
+                    if chunk is not None:
+                        yield chunk
+                    # Drop pieces from the front until what is left fits the overlap
+                    while total > chunk_overlap or (
+                            total + length + (separator_len if current else 0) > chunk_size
+                            and total > 0):
+                        total -= len(current[0][0]) + (separator_len if len(current) > 1 else 0)
+                        current.popleft()
+            current.append((piece, offset, breaks))
+            total += length + (separator_len if len(current) > 1 else 0)
+        chunk = _join(current, separator, source)
+        if chunk is not None:
+            yield chunk
+
+
+def _join(pieces, separator, source):
+    text = separator.join(piece for piece, _, _ in pieces)
+    stripped = text.strip()
+    if not stripped:
+        return None
+    # Locate the piece the stripped text starts in, since separators dropped
+    # between pieces mean the joined text is not a slice of the original
+    leading = len(text) - len(text.lstrip())
+    position = 0
+    for piece, offset, breaks in pieces:
+        if leading < position + len(piece):
+            start = offset + max(leading - position, 0)
+            page = [page for break_offset, page in breaks if break_offset <= start][-1]
+            return Chunk(stripped, source, page, start)
+        position += len(piece) + len(separator)
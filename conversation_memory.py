@@ -0,0 +1,55 @@
+from typing import List
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.schema.messages import get_buffer_string
+
+# Chat memory with a token budget for the retrieval chain. The latest turns
+# are kept verbatim up to max_token_limit; turns pushed out of the budget are
+# folded into a rolling summary, which only sends the LLM the previous summary
+# and the turns being dropped. Each message is tokenized once, when it is
+# added, instead of re-counting the whole buffer on every prune.
+CHARS_PER_TOKEN = 4
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    message_tokens: List[int] = []  # tokens of each message still in the buffer
+    summary_tokens: int = 0
+    history_tokens: List[int] = []  # history tokens sent with each question
+
+    def count_tokens(self, text):
+        try:
+            return self.llm.get_num_tokens(text)
+        except ImportError:
+            # langchain's default counter needs transformers, estimate without it
+            return max(1, len(text) // CHARS_PER_TOKEN)
+
+    def _count_new_messages(self):
+        messages = self.chat_memory.messages
+        self.message_tokens.extend(
+            self.count_tokens(get_buffer_string([message], human_prefix=self.human_prefix, ai_prefix=self.ai_prefix))
+            for message in messages[len(self.message_tokens):])
+
+    def load_memory_variables(self, inputs):
+        # Called once per question, so this records what each turn sends
+        self._count_new_messages()
+        self.history_tokens.append(self.summary_tokens + sum(self.message_tokens))
+        return super().load_memory_variables(inputs)
+
+    def prune(self):
+        messages = self.chat_memory.messages
+        self._count_new_messages()
+        total = sum(self.message_tokens)
+        pruned = []
+        # whole turns (question and answer) leave the buffer, oldest first
+        while total > self.max_token_limit and messages:
+            for _ in range(min(2, len(messages))):
+                pruned.append(messages.pop(0))
+                total -= self.message_tokens.pop(0)
+        if pruned:
+            self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+            self.summary_tokens = self.count_tokens(self.moving_summary_buffer)
+
+    def clear(self):
+        super().clear()
+        self.message_tokens = []
+        self.summary_tokens = 0
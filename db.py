@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import metrics
+import migrations
+import policy_parser
+
+# Shared SQLite access for the policy database. Each thread keeps one open
+# connection per database file, in WAL mode so readers don't block the writer.
+DATABASE_PATH = os.getenv('INSURANCE_DB', 'insurance.db')
+BUSY_TIMEOUT = 30
+FETCH_BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+def get_connection(db_path=DATABASE_PATH):
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        connections[db_path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path=DATABASE_PATH):
+    # Commits on success, rolls back if the block raises
+    conn = get_connection(db_path)
+    with metrics.span('db_transaction'), conn:
+        yield conn
+
+
+def close_connections():
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def insert_policy(conn, policy_info):
+    # Caller owns the transaction, so many policies can share one commit
+    insured_str = ', '.join(policy_info.insured) if policy_info.insured else ''
+    type_of_insurance_str = ', '.join(policy_info.insurance_types) if policy_info.insurance_types else ''
+    cursor = conn.execute('''INSERT INTO insurance_policies
+                             (total_coverage_amount, type_of_insurance, annual_premium, insurer, insured,
+                              issue_date, renewal_date, policy_number,
+                              total_coverage_amount_value, annual_premium_value)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (policy_info.total_coverage_amount, type_of_insurance_str, policy_info.annual_premium,
+                           policy_info.insurer, insured_str, policy_info.issue_date, policy_info.renewal_date,
+                           policy_info.policy_number, policy_parser.parse_amount(policy_info.total_coverage_amount),
+                           policy_parser.parse_amount(policy_info.annual_premium)))
+    policy_id = cursor.lastrowid
+    items = []
+    for category, details in policy_info.categories.items():
+        # The joined text columns are still read by visu.py's chart query
+        category_id = conn.execute('''INSERT INTO categories
+                                      (policy_id, category_name, covered, not_covered, events_covered)
+                                      VALUES (?, ?, ?, ?, ?)''',
+                                   (policy_id, category, *(', '.join(details.get(kind, []))
+                                                           for kind in migrations.COVERAGE_KINDS))).lastrowid
+        items.extend((policy_id, category_id, kind, position, item)
+                     for kind in migrations.COVERAGE_KINDS
+                     for position, item in enumerate(details.get(kind, [])))
+    conn.executemany('''INSERT INTO coverage_items (policy_id, category_id, kind, position, item)
+                        VALUES (?, ?, ?, ?, ?)''', items)
+    metrics.inc('db_rows_written_total', 1 + len(policy_info.categories) + len(items))
+    return policy_id
+
+
+def fetch_all(query, params=(), db_path=DATABASE_PATH):
+    return get_connection(db_path).execute(query, params).fetchall()
+
+
+def iter_rows(query, params=(), db_path=DATABASE_PATH, batch_size=FETCH_BATCH_SIZE):
+    # Streams a result set batch by batch instead of loading it whole
+    cursor = get_connection(db_path).execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
@@ -0,0 +1,73 @@
+from langchain.vectorstores import FAISS
+from hybrid_retriever import BM25Index
+
+# Keeps track of which chunks in a FAISS store belong to which uploaded
+# document, so a document can be added or removed without re-embedding the
+# rest of the corpus. Documents are identified by the hash of their bytes.
+INDEX_BATCH_SIZE = 256
+
+
+class DocumentIndex:
+    def __init__(self, embedder, vectorstore=None):
+        self.embedder = embedder
+        self.vectorstore = vectorstore
+        self.documents = {}  # doc_id -> docstore ids of its chunks
+        # keyword index over the same chunks, for HybridRetriever
+        self.keyword_index = BM25Index.from_vectorstore(vectorstore) if vectorstore is not None else BM25Index()
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, embedder):
+        index = cls(embedder, vectorstore)
+        for docstore_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(docstore_id)
+            doc_id = getattr(doc, 'metadata', {}).get('doc_id')
+            if doc_id is not None:
+                index.documents.setdefault(doc_id, []).append(docstore_id)
+        return index
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def add_document(self, doc_id, chunks, batch_size=INDEX_BATCH_SIZE):
+        if doc_id in self.documents:
+            return 0
+        ids = []
+        batch = []
+        try:
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) == batch_size:
+                    ids.extend(self._add_batch(doc_id, batch, len(ids)))
+                    batch = []
+            if batch:
+                ids.extend(self._add_batch(doc_id, batch, len(ids)))
+        except Exception:
+            # a document is either fully indexed or not at all, batches already
+            # added would otherwise stay in the store with no way to remove them
+            if ids:
+                self.vectorstore.delete(ids)
+                self.keyword_index.remove(ids)
+            raise
+        self.documents[doc_id] = ids
+        return len(ids)
+
+    def _add_batch(self, doc_id, chunks, start):
+        texts = [chunk.text for chunk in chunks]
+        metadatas = [dict(chunk.metadata, doc_id=doc_id) for chunk in chunks]
+        ids = [f'{doc_id}:{start + i}' for i in range(len(chunks))]
+        text_embeddings = list(zip(texts, self.embedder.embed_documents(texts)))
+        if self.vectorstore is None:
+            self.vectorstore = FAISS.from_embeddings(
+                text_embeddings, self.embedder, metadatas=metadatas, ids=ids)
+        else:
+            self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        for docstore_id, text in zip(ids, texts):
+            self.keyword_index.add(docstore_id, text)
+        return ids
+
+    def remove_document(self, doc_id):
+        ids = self.documents.pop(doc_id, None)
+        if ids:
+            self.vectorstore.delete(ids)
+            self.keyword_index.remove(ids)
+        return len(ids or [])
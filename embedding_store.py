@@ -0,0 +1,148 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from langchain.embeddings.base import Embeddings
+
+import metrics
+
+# Persistent cache of chunk embeddings, keyed by a hash of the chunk text, so
+# boilerplate shared between policies is only sent to the embedder once.
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'embeddings.db')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+
+# Stay under SQLite's default limit on bound parameters
+_MAX_PARAMS = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS embeddings (
+                                namespace TEXT,
+                                text_hash TEXT,
+                                vector BLOB,
+                                PRIMARY KEY (namespace, text_hash)
+                              )''')
+        self._conn.commit()
+
+    def get_many(self, namespace, hashes):
+        found = {}
+        hashes = list(hashes)
+        with self._lock:
+            for start in range(0, len(hashes), _MAX_PARAMS):
+                batch = hashes[start:start + _MAX_PARAMS]
+                placeholders = ', '.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f'SELECT text_hash, vector FROM embeddings '
+                    f'WHERE namespace = ? AND text_hash IN ({placeholders})',
+                    [namespace, *batch])
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, namespace, items):
+        rows = [(namespace, key, array('f', vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (namespace, text_hash, vector) VALUES (?, ?, ?)',
+                rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EmbeddingStore()
+        return _default_store
+
+
+class CachedEmbeddings(Embeddings):
+    # Wraps any embedder exposing embed_documents/embed_query and only sends
+    # chunks it has not seen before, in batches of batch_size.
+    def __init__(self, embedder, store=None, namespace=None, batch_size=EMBEDDING_BATCH_SIZE):
+        self.embedder = embedder
+        self.store = store or get_default_store()
+        self.namespace = namespace or _namespace_for(embedder)
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.store.get_many(self.namespace, set(hashes))
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[start:start + self.batch_size]
+            with metrics.span('embed', model=self.namespace):
+                embedded = self.embedder.embed_documents([text for _, text in batch])
+            new_vectors = [(key, vector) for (key, _), vector in zip(batch, embedded)]
+            self.store.put_many(self.namespace, new_vectors)
+            vectors.update(new_vectors)
+
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        metrics.inc('embedding_chunks_total', len(missing), result='computed')
+        metrics.inc('embedding_chunks_total', len(texts) - len(missing), result='reused')
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text):
+        return self.embedder.embed_query(text)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def _namespace_for(embedder):
+    model = getattr(embedder, 'model', None) or getattr(embedder, 'model_name', None)
+    name = type(embedder).__name__
+    return f'{name}:{model}' if model else name
+
+
+class HashEmbeddings(Embeddings):
+    # Deterministic local stand-in for tests and benchmarks: hashes word
+    # tokens into a fixed number of buckets and L2-normalises the result.
+    def __init__(self, size=256):
+        self.size = size
+        self.model = f'hash-{size}'
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for token in re.findall(r'\w+', text.lower()):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
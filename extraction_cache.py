@@ -0,0 +1,44 @@
+import json
+import time
+import db
+
+# Parsed policy summaries keyed by the hash of the uploaded PDF and the
+# prompt/model version that produced them. Entries live next to the policy
+# tables so a hit can be checked against the row it was inserted as.
+
+
+class ExtractionCache:
+    def __init__(self, db_path=db.DATABASE_PATH):
+        self.db_path = db_path
+
+    def setup(self):
+        with db.transaction(self.db_path) as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS extraction_cache (
+                                doc_hash TEXT,
+                                version TEXT,
+                                policy_id INTEGER,
+                                payload TEXT,
+                                created_at REAL,
+                                PRIMARY KEY (doc_hash, version)
+                              )''')
+
+    def get(self, doc_hash, version):
+        # Only a hit while the policy it was stored as still exists
+        row = db.get_connection(self.db_path).execute(
+            '''SELECT c.policy_id, c.payload FROM extraction_cache c
+               JOIN insurance_policies p ON p.id = c.policy_id
+               WHERE c.doc_hash = ? AND c.version = ?''',
+            (doc_hash, version)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put(self, doc_hash, version, policy_id, payload, conn=None):
+        # Pass conn to write as part of the caller's transaction
+        if conn is None:
+            with db.transaction(self.db_path) as conn:
+                return self.put(doc_hash, version, policy_id, payload, conn)
+        conn.execute('''INSERT OR REPLACE INTO extraction_cache
+                        (doc_hash, version, policy_id, payload, created_at)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     (doc_hash, version, policy_id, json.dumps(payload), time.time()))
@@ -0,0 +1,168 @@
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Optional
+
+import numpy as np
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever
+
+import metrics
+
+# Keyword (BM25) search over the same chunks as the FAISS store, fused with
+# the dense results by reciprocal rank. Exact terms such as clause numbers,
+# policy numbers and exclusion names are found by the keyword side even when
+# their embeddings are not close to the question's, so fewer chunks need to
+# be sent to the LLM.
+RETRIEVER_K = int(os.getenv('RETRIEVER_K', '3'))
+RETRIEVER_FETCH_K = int(os.getenv('RETRIEVER_FETCH_K', '20'))
+RRF_K = 60  # damping constant of reciprocal rank fusion
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words and identifiers such as "4.2.1", "hx-48213" or "co-pay"; compound
+# identifiers are indexed whole and by their parts
+_TOKEN = re.compile(r'\w+(?:[.\-/]\w+)*')
+_PART = re.compile(r'\w+')
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_PART.findall(token))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # token -> {docstore id: term frequency}
+        self.lengths = {}  # docstore id -> number of tokens
+        self.terms = {}  # docstore id -> distinct tokens, to find its postings on removal
+        self.total_length = 0
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        index = cls()
+        for docstore_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(docstore_id)
+            if hasattr(doc, 'page_content'):
+                index.add(docstore_id, doc.page_content)
+        return index
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, docstore_id, text):
+        if docstore_id in self.lengths:
+            self.remove([docstore_id])
+        counts = Counter(tokenize(text))
+        for token, count in counts.items():
+            self.postings.setdefault(token, {})[docstore_id] = count
+        length = sum(counts.values())
+        self.lengths[docstore_id] = length
+        self.terms[docstore_id] = tuple(counts)
+        self.total_length += length
+
+    def remove(self, docstore_ids):
+        for docstore_id in docstore_ids:
+            if docstore_id not in self.lengths:
+                continue
+            for token in self.terms.pop(docstore_id):
+                postings = self.postings[token]
+                del postings[docstore_id]
+                if not postings:
+                    del self.postings[token]
+            self.total_length -= self.lengths.pop(docstore_id)
+
+    def search(self, query, n):
+        # [(docstore id, score)], best first
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average = self.total_length / count
+        scores = {}
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for docstore_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[docstore_id] / average)
+                scores[docstore_id] = scores.get(docstore_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
+
+
+def dense_search(vectorstore, query, n):
+    # Same search as FAISS.similarity_search, but keeps the docstore ids
+    embedder = vectorstore.embedding_function
+    embedding = embedder.embed_query(query) if hasattr(embedder, 'embed_query') else embedder(query)
+    vector = np.array([embedding], dtype=np.float32)
+    if getattr(vectorstore, '_normalize_L2', False):
+        vector /= np.linalg.norm(vector) or 1.0
+    scores, indices = vectorstore.index.search(vector, n)
+    return [(vectorstore.index_to_docstore_id[i], float(score))
+            for i, score in zip(indices[0], scores[0]) if i != -1]
+
+
+def reciprocal_rank_fusion(rankings, weights=None, k=RRF_K):
+    # rankings are lists of ids, best first; returns ids by fused score
+    weights = weights or [1.0] * len(rankings)
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, docstore_id in enumerate(ranking):
+            fused[docstore_id] = fused.get(docstore_id, 0.0) + weight / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+class TermOverlapReranker:
+    # Lightweight reranker: orders candidates by how many distinct query terms
+    # they contain, identifiers with digits counting extra, keeping the fused
+    # order between equal scores
+    def __init__(self, identifier_weight=3.0):
+        self.identifier_weight = identifier_weight
+
+    def __call__(self, query, docs):
+        terms = set(tokenize(query))
+        weights = {term: self.identifier_weight if any(c.isdigit() for c in term) else 1.0 for term in terms}
+
+        def score(doc):
+            doc_terms = set(tokenize(doc.page_content))
+            return sum(weight for term, weight in weights.items() if term in doc_terms)
+
+        scores = [score(doc) for doc in docs]
+        order = sorted(range(len(docs)), key=lambda i: -scores[i])
+        return [docs[i] for i in order]
+
+
+class HybridRetriever(BaseRetriever):
+    vectorstore: Any
+    keyword_index: Any
+    k: int = RETRIEVER_K
+    fetch_k: int = RETRIEVER_FETCH_K
+    dense_weight: float = 1.0
+    keyword_weight: float = 1.0
+    reranker: Optional[Any] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        with metrics.span('retrieve_dense'):
+            dense = [docstore_id for docstore_id, _ in dense_search(self.vectorstore, query, self.fetch_k)]
+        with metrics.span('retrieve_keyword'):
+            keyword = [docstore_id for docstore_id, _ in self.keyword_index.search(query, self.fetch_k)]
+        fused = reciprocal_rank_fusion([dense, keyword], [self.dense_weight, self.keyword_weight])
+        # the reranker gets the fused top fetch_k to choose from
+        fused = fused[:self.k if self.reranker is None else self.fetch_k]
+        docs = [self.vectorstore.docstore.search(docstore_id) for docstore_id in fused]
+        docs = [doc for doc in docs if hasattr(doc, 'page_content')]
+        if self.reranker is not None:
+            with metrics.span('rerank'):
+                docs = self.reranker(query, docs)
+        return docs[:self.k]
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+# On-disk cache of built vector stores, keyed by the uploaded files and the
+# settings used to chunk and embed them.
+CACHE_DIR = os.getenv('INDEX_CACHE_DIR', '.index_cache')
+CACHE_MAX_ENTRIES = int(os.getenv('INDEX_CACHE_MAX_ENTRIES', '32'))
+CACHE_MAX_BYTES = int(os.getenv('INDEX_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+
+def is_pinned(key):
+    # Replaced by the app: entries of stores held in memory are not evicted, the
+    # copy in memory may be one that cannot be saved in their place
+    return False
+
+
+def file_digest(pdf):
+    # Streamlit's UploadedFile is a BytesIO, plain paths are read from disk
+    if isinstance(pdf, (str, os.PathLike)):
+        with open(pdf, 'rb') as f:
+            data = f.read()
+    elif hasattr(pdf, 'getvalue'):
+        data = pdf.getvalue()
+    else:
+        data = pdf
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(pdf_docs, **settings):
+    h = hashlib.sha256()
+    # The same set of files should hit regardless of upload order
+    for digest in sorted(file_digest(pdf) for pdf in pdf_docs):
+        h.update(digest.encode())
+    for name in sorted(settings):
+        h.update(f'{name}={settings[name]}\n'.encode())
+    return h.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key)
+
+
+def lookup(key):
+    path = _entry_path(key)
+    if not os.path.isdir(path):
+        return None
+    # Touch the entry so eviction sees it as recently used
+    now = time.time()
+    os.utime(path, (now, now))
+    return path
+
+
+def store(key, vectorstore):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _entry_path(key)
+    tmp_path = tempfile.mkdtemp(dir=CACHE_DIR, prefix='.tmp-')
+    try:
+        vectorstore.save_local(tmp_path)
+        if os.path.isdir(path):
+            # Another worker stored the same key first, keep theirs
+            shutil.rmtree(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    # callers go on to use the entry, so it stays even when it alone is over the limits
+    evict(keep=path)
+    return path
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def evict(max_entries=None, max_bytes=None, keep=None):
+    max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return []
+
+    entries = []
+    kept = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        if path == keep or is_pinned(name):
+            kept.append(path)
+        else:
+            entries.append((os.path.getmtime(path), _dir_size(path), path))
+
+    # Oldest first, drop until both limits are satisfied
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries) + sum(_dir_size(path) for path in kept)
+    evicted = []
+    while entries and (len(entries) + len(kept) > max_entries or total_bytes > max_bytes):
+        _, size, path = entries.pop(0)
+        shutil.rmtree(path, ignore_errors=True)
+        total_bytes -= size
+        evicted.append(path)
+    return evicted
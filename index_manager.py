@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever
+
+import metrics
+
+# One in-memory copy of each vector store per process, keyed by the index
+# cache key, so sessions that processed the same files share it instead of
+# each holding their own. Sessions keep only the key (ManagedRetriever).
+# Least recently used stores are dropped once the resident total passes the
+# budget and loaded from disk again by the next question that needs them.
+INDEX_MEMORY_BUDGET = int(os.getenv('INDEX_MEMORY_BUDGET_MB', '1024')) * 1024 * 1024
+# rough sizes of the Python objects behind each chunk, for the estimate
+DOCUMENT_OVERHEAD_BYTES = 600
+POSTING_BYTES = 100
+
+
+class IndexUnavailable(Exception):
+    pass
+
+
+def _code_bytes(index):
+    # per vector; a refined compressed index holds PQ and refinement codes
+    if hasattr(index, 'refine_index'):
+        import faiss
+        return _code_bytes(faiss.downcast_index(index.base_index)) + \
+            _code_bytes(faiss.downcast_index(index.refine_index))
+    return getattr(index, 'code_size', index.d * 4)
+
+
+def estimate_bytes(vectorstore, keyword_index=None):
+    # Vector codes plus chunk text and docstore objects, plus BM25 postings
+    index = vectorstore.index
+    size = index.ntotal * _code_bytes(index)
+    for doc in getattr(vectorstore.docstore, '_dict', {}).values():
+        size += len(doc.page_content) + DOCUMENT_OVERHEAD_BYTES
+    if keyword_index is not None:
+        size += POSTING_BYTES * sum(len(postings) for postings in keyword_index.postings.values())
+    return size
+
+
+class ResidentIndex:
+    def __init__(self, key, vectorstore, retriever, size):
+        self.key = key
+        self.vectorstore = vectorstore
+        self.retriever = retriever
+        self.bytes = size
+        self.last_used = time.time()
+
+
+class IndexManager:
+    def __init__(self, loader, build_retriever, persist=None, touch=None, budget_bytes=INDEX_MEMORY_BUDGET):
+        # loader(key) returns the store saved under key or None,
+        # build_retriever(vectorstore, keyword_index) the retriever to search it with,
+        # persist(key, vectorstore) makes sure a store is on disk before it is dropped,
+        # touch(key) marks the saved copy as used when the one in memory is
+        self.loader = loader
+        self.build_retriever = build_retriever
+        self.persist = persist
+        self.touch = touch
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> ResidentIndex, least recently used first
+        self._persisting = {}  # key -> ResidentIndex evicted and still being written to disk
+        self._loading = {}  # key -> lock held while that key is loaded
+        self._lock = threading.Lock()
+
+    def put(self, key, vectorstore, keyword_index=None):
+        # Registers a store built by a session; if another session registered
+        # the same key first, that copy is returned and this one is dropped
+        with self._lock:
+            resident = self._resident(key)
+            victims = self._evict()
+        self._persist(victims)
+        if resident is not None:
+            self._touch(key)
+            return resident
+        entry = self._entry(key, vectorstore, keyword_index)
+        with self._lock:
+            resident = self._resident(key)
+            if resident is None:
+                self._entries[key] = entry
+            victims = self._evict()
+        self._persist(victims)
+        return resident or entry
+
+    def get(self, key):
+        # The resident store for key, loaded from disk if needed; None when
+        # nothing is saved under key. Concurrent requests for a key load it once
+        with self._lock:
+            entry = self._resident(key)
+            victims = self._evict()
+            if entry is None:
+                key_lock = self._loading.setdefault(key, threading.Lock())
+        self._persist(victims)
+        if entry is not None:
+            self._touch(key)
+            return entry
+        with key_lock:
+            with self._lock:
+                entry = self._resident(key)
+                victims = self._evict()
+            self._persist(victims)
+            if entry is not None:
+                self._touch(key)
+                return entry
+            victims = []
+            try:
+                with metrics.span('index_reload'):
+                    vectorstore = self.loader(key)
+                if vectorstore is not None:
+                    entry = self._entry(key, vectorstore, None)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                    if entry is not None:
+                        self._entries[key] = entry
+                        self.loads += 1
+                        victims = self._evict()
+        self._persist(victims)
+        if entry is not None:
+            metrics.inc('index_loads_total')
+        return entry
+
+    def _entry(self, key, vectorstore, keyword_index):
+        retriever = self.build_retriever(vectorstore, keyword_index)
+        # only a keyword index the retriever keeps counts towards the budget
+        size = estimate_bytes(vectorstore, getattr(retriever, 'keyword_index', None))
+        return ResidentIndex(key, vectorstore, retriever, size)
+
+    def _resident(self, key):
+        # Under self._lock: the entry for key as most recently used, counted as
+        # a hit, taking back one that is still being written out after eviction
+        # (callers then _evict, that may put the resident total over budget)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._persisting.get(key)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+        self._entries.move_to_end(key)
+        entry.last_used = time.time()
+        self.hits += 1
+        return entry
+
+    def _evict(self):
+        # Under self._lock: takes the least recently used stores out until the
+        # rest fit the budget, the caller persists them once the lock is released.
+        # The most recently used store stays even when it alone is over budget
+        victims = []
+        while len(self._entries) > 1 and self.resident_bytes() > self.budget_bytes:
+            key, entry = self._entries.popitem(last=False)
+            self._persisting[key] = entry
+            victims.append(entry)
+            self.evictions += 1
+        return victims
+
+    def _persist(self, victims):
+        # Disk writes happen outside the lock, a get() meanwhile takes the
+        # store back from _persisting instead of loading a copy
+        for entry in victims:
+            try:
+                if self.persist is not None:
+                    self.persist(entry.key, entry.vectorstore)
+            finally:
+                with self._lock:
+                    if self._persisting.get(entry.key) is entry:
+                        del self._persisting[entry.key]
+            metrics.inc('index_evictions_total')
+
+    def _touch(self, key):
+        # outside the lock, a store served from memory for a long time would
+        # otherwise look unused to the eviction of the saved copies
+        if self.touch is not None:
+            self.touch(key)
+
+    def holds(self, key):
+        # whether the store for key is in memory, or still being written out
+        with self._lock:
+            return key in self._entries or key in self._persisting
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def resident_bytes(self):
+        return sum(entry.bytes for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {'resident': len(self._entries), 'bytes': self.resident_bytes(), 'budget_bytes': self.budget_bytes,
+                    'hits': self.hits, 'loads': self.loads, 'evictions': self.evictions}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class ManagedRetriever(BaseRetriever):
+    # What a session's chain holds instead of the store: the key, looked up
+    # on every question so an evicted store is loaded again when needed
+    index_key: str
+    manager: Any
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        entry = self.manager.get(self.index_key)
+        if entry is None:
+            # an answer without the documents would look like one drawn from them
+            raise IndexUnavailable(f'no index saved under {self.index_key}')
+        return entry.retriever.get_relevant_documents(query, callbacks=run_manager.get_child())
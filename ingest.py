@@ -0,0 +1,148 @@
+"""Bulk, resumable ingestion of a directory of policy PDFs.
+
+    python ingest.py /path/to/policies --workers 8 --llm-concurrency 8 --batch-size 200
+
+Text is extracted in a process pool and the LLM extraction runs on a bounded
+thread pool, with only a small window of documents in flight at each stage.
+Parsed policies are committed in batches, each policy together with its
+extraction_cache entry (PDF hash + extraction version). That entry is the
+checkpoint: a rerun after a crash hashes the files again, skips every one
+already committed and only redoes the batch that was in progress. Documents
+that fail are reported and retried on the next run.
+
+Uses the same database (INSURANCE_DB) and OpenAI settings as viz.py.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import db
+import pdf_extract
+from index_cache import file_digest
+from policy_extraction import EXTRACTION_VERSION, extraction_cache, query_openai_and_parse, setup_database
+
+
+def find_pdfs(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                yield os.path.join(root, name)
+
+
+def _init_extract_worker():
+    # Each worker reads whole documents; the pool already spreads the load
+    pdf_extract.EXTRACT_WORKERS = 1
+
+
+def _extract_text(item):
+    path, doc_hash = item
+    try:
+        return path, doc_hash, pdf_extract.extract_document(path).text, None
+    except Exception as e:
+        return path, doc_hash, None, e
+
+
+def _parse(item):
+    path, doc_hash, text, error = item
+    if error is not None:
+        return path, doc_hash, None, error
+    try:
+        return path, doc_hash, query_openai_and_parse(text), None
+    except Exception as e:
+        return path, doc_hash, None, e
+
+
+def _imap_unordered(pool, fn, items, window):
+    # Like pool.map, but yields as results finish and only pulls a new item
+    # from `items` when fewer than `window` are in flight
+    futures = set()
+    for item in items:
+        futures.add(pool.submit(fn, item))
+        if len(futures) >= window:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    while futures:
+        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+class Ingester:
+    def __init__(self, workers, llm_concurrency, batch_size):
+        self.workers = workers
+        self.llm_concurrency = llm_concurrency
+        self.batch_size = batch_size
+        self.found = 0
+        self.skipped = 0
+        self.ingested = 0
+        self.failed = 0
+        self.started = None
+
+    def pending(self, paths):
+        # Files whose policy is already committed are the checkpoint
+        seen = set()
+        for path in paths:
+            self.found += 1
+            doc_hash = file_digest(path)
+            if doc_hash in seen or extraction_cache.get(doc_hash, EXTRACTION_VERSION) is not None:
+                self.skipped += 1
+                continue
+            seen.add(doc_hash)
+            yield path, doc_hash
+
+    def commit(self, batch):
+        with db.transaction() as conn:
+            for doc_hash, policy_info in batch:
+                policy_id = db.insert_policy(conn, policy_info)
+                extraction_cache.put(doc_hash, EXTRACTION_VERSION, policy_id, policy_info.to_dict(), conn)
+        self.ingested += len(batch)
+        print(f"committed {self.ingested} ({self.rate():.2f} docs/s), "
+              f"{self.skipped} already ingested, {self.failed} failed")
+
+    def rate(self):
+        return self.ingested / max(time.perf_counter() - self.started, 1e-9)
+
+    def run(self, paths):
+        self.started = time.perf_counter()
+        batch = []
+        with ProcessPoolExecutor(self.workers, initializer=_init_extract_worker) as extract_pool, \
+                ThreadPoolExecutor(self.llm_concurrency) as llm_pool:
+            texts = _imap_unordered(extract_pool, _extract_text, self.pending(paths), self.workers * 2)
+            for path, doc_hash, policy_info, error in _imap_unordered(llm_pool, _parse, texts,
+                                                                      self.llm_concurrency * 2):
+                if error is not None:
+                    self.failed += 1
+                    print(f"failed {path}: {error!r}")
+                    continue
+                batch.append((doc_hash, policy_info))
+                if len(batch) >= self.batch_size:
+                    self.commit(batch)
+                    batch = []
+            if batch:
+                self.commit(batch)
+        return time.perf_counter() - self.started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes extracting PDF text')
+    parser.add_argument('--llm-concurrency', type=int, default=4,
+                        help='documents being sent to the LLM at once; long documents also split '
+                             'into up to EXTRACTION_CONCURRENCY segment calls each')
+    parser.add_argument('--batch-size', type=int, default=100, help='policies per database transaction')
+    args = parser.parse_args()
+
+    setup_database()
+    ingester = Ingester(args.workers, args.llm_concurrency, args.batch_size)
+    seconds = ingester.run(find_pdfs(args.directory))
+    print(f"{ingester.found} PDFs found: {ingester.ingested} ingested, {ingester.skipped} already ingested, "
+          f"{ingester.failed} failed in {seconds:.1f}s ({ingester.rate():.2f} docs/s)")
+
+
+if __name__ == '__main__':
+    main()
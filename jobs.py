@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+
+# Background processing for uploads: requests enqueue a job and return its id,
+# a bounded pool of worker threads runs the pipeline and records how long each
+# stage took. Progress is also kept as an ordered list of events per job that
+# clients can follow as it grows; a finished job keeps only its final event.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '32'))
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', '1000'))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_queue):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.current_stage = None
+        self.stages = {}
+        self.events = []  # (event, data), in the order they happened
+        self.first_event = 0  # position of events[0], earlier ones were dropped
+        self._changed = threading.Condition()
+        self._queue = job_queue
+
+    @contextmanager
+    def stage(self, name):
+        self.current_stage = name
+        self.emit('stage', {'stage': name})
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, elapsed):
+        # also used for timings that are not a block, such as the first token
+        self.stages[name] = elapsed
+        self._queue._record_stage(name, elapsed)
+
+    def emit(self, event, data=None):
+        with self._changed:
+            self.events.append((event, data))
+            self._changed.notify_all()
+
+    def finish(self):
+        # the last event and finished_at change together, so a follower never
+        # sees the job finished without its final event
+        with self._changed:
+            self.finished_at = time.time()
+            self.emit(self.status, {'error': self.error} if self.error else None)
+            # progress (a summary event per streamed token) is of no use any more
+            self.first_event += len(self.events) - 1
+            self.events = self.events[-1:]
+
+    def wait_events(self, start, timeout):
+        # The position of the first event returned and the events from position
+        # start on, or from the final one if the job finished and dropped those,
+        # waiting up to timeout for the first one; empty once the job has
+        # finished and they were all returned
+        with self._changed:
+            if self.first_event + len(self.events) <= start and self.finished_at is None:
+                self._changed.wait(timeout)
+            start = max(start, self.first_event)
+            return start, self.events[start - self.first_event:]
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.current_stage,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'stages': self.stages,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, retention=JOB_RETENTION):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._stage_stats = {}  # name -> [count, total seconds, max seconds]
+
+    def submit(self, fn, *args):
+        # fn is called as fn(job, *args) on a worker and its return value
+        # becomes the job result
+        with self._lock:
+            if self._queued >= self.max_pending:
+                raise QueueFull(f'{self._queued} jobs already waiting')
+            job = Job(self)
+            self._jobs[job.id] = job
+            self._queued += 1
+            self._prune()
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        job.status = 'running'
+        job.started_at = time.time()
+        self._record_stage('queue_wait', job.started_at - job.created_at)
+        try:
+            job.result = fn(job, *args)
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finish()
+            metrics.inc('jobs_total', status=job.status)
+            with self._lock:
+                self._running -= 1
+
+    def _record_stage(self, name, elapsed):
+        metrics.observe('job_stage_seconds', elapsed, stage=name)
+        with self._lock:
+            stats = self._stage_stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+    def _prune(self):
+        # Forget the oldest finished jobs once more than retention are held
+        excess = len(self._jobs) - self.retention
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished_at is not None:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self._queued,
+                'running': self._running,
+                'stages': {
+                    name: {
+                        'count': count,
+                        'avg_seconds': total / count,
+                        'max_seconds': longest,
+                    }
+                    for name, (count, total, longest) in self._stage_stats.items()
+                },
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,70 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Helpers for running one LLM call per segment of a long document: split the
+# text, call the model for every segment with bounded parallelism, and retry
+# calls that were rate limited or failed transiently.
+SEGMENT_SIZE = int(os.getenv('EXTRACTION_SEGMENT_CHARS', '3000'))
+SEGMENT_OVERLAP = int(os.getenv('EXTRACTION_SEGMENT_OVERLAP', '200'))
+# A document takes ceil(segments / MAX_CONCURRENCY) rounds of calls: a 20 page
+# policy (about 35 segments) is 9 rounds, so about 9x the latency of one call
+# (benchmarks.bench_extraction). The default suits low rate limits; raise it
+# as far as the account's requests per minute allow, since ingest.py runs
+# several documents at once, each with up to this many calls
+MAX_CONCURRENCY = int(os.getenv('EXTRACTION_CONCURRENCY', '4'))
+MAX_RETRIES = int(os.getenv('EXTRACTION_MAX_RETRIES', '5'))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+
+def split_segments(text, size=SEGMENT_SIZE, overlap=SEGMENT_OVERLAP):
+    # Cut at the last paragraph or line break before the size limit when there
+    # is one in the second half of the window, so clauses stay together
+    segments = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            for separator in ('\n\n', '\n', '. '):
+                cut = text.rfind(separator, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        segments.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return segments
+
+
+def call_with_retry(fn, retry_on, retries=MAX_RETRIES, base_delay=RETRY_BASE_DELAY):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except retry_on as e:
+            if attempt == retries:
+                raise
+            time.sleep(_retry_delay(e, attempt, base_delay))
+
+
+def _retry_delay(error, attempt, base_delay):
+    # Prefer the server's Retry-After, otherwise exponential backoff with jitter
+    headers = getattr(error, 'headers', None) or {}
+    retry_after = headers.get('retry-after') or headers.get('Retry-After')
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    delay = min(base_delay * 2 ** attempt, RETRY_MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def map_segments(fn, segments, max_workers=MAX_CONCURRENCY):
+    # Results come back in segment order whatever order the calls finish in
+    if len(segments) <= 1:
+        return [fn(segment) for segment in segments]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(segments))) as executor:
+        return list(executor.map(fn, segments))
@@ -0,0 +1,171 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+# Process-wide timings and counters for both apps. Pipeline stages are timed
+# with `with metrics.span('pdf_extract'):`, which feeds the stage_seconds
+# histogram and keeps the most recent spans, with the span they ran inside,
+# for the Streamlit panel. Flask serves everything in the Prometheus text
+# format on /metrics. With METRICS_ENABLED=0 span() returns one shared no-op
+# object and inc()/observe() return at once.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_PREFIX = 'chatbot_'
+RECENT_SPANS = int(os.getenv('METRICS_RECENT_SPANS', '200'))
+# seconds, from a cached lookup up to a long LLM call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # per bucket, last is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+class Registry:
+    def __init__(self, enabled=METRICS_ENABLED, buckets=LATENCY_BUCKETS, recent=RECENT_SPANS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.counters = {}  # (name, labels) -> value, labels a sorted tuple of pairs
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def span(self, name, **labels):
+        return Span(self, name, labels)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def stage_summary(self):
+        # [(stage, count, mean seconds, max seconds)] of the stage_seconds histogram
+        with self._lock:
+            rows = [(dict(labels).get('stage'), h.count, h.sum / h.count, h.max)
+                    for (name, labels), h in self.histograms.items() if name == 'stage_seconds' and h.count]
+        return sorted(rows, key=lambda row: row[0])
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.count, h.sum) for key, h in histograms]
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_labels(labels)} {value}')
+        for (name, labels), counts, count, total in histograms:
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} histogram')
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{metric}_sum{_labels(labels)} {total}')
+            lines.append(f'{metric}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.recent.clear()
+
+
+class Span:
+    __slots__ = ('registry', 'name', 'labels', 'parent', 'started', 'seconds', 'error')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.parent = None
+        self.seconds = None
+        self.error = False
+
+    def __enter__(self):
+        stack = self.registry._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.started
+        self.registry._stack().pop()
+        self.error = exc_type is not None
+        self.registry.observe('stage_seconds', self.seconds, stage=self.name, **self.labels)
+        if self.error:
+            self.registry.inc('stage_errors_total', stage=self.name)
+        self.registry.recent.append(self)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+registry = Registry()
+
+
+def span(name, **labels):
+    if not registry.enabled:
+        return _NOOP_SPAN
+    return registry.span(name, **labels)
+
+
+def inc(name, value=1, **labels):
+    if registry.enabled:
+        registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if registry.enabled:
+        registry.observe(name, value, **labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
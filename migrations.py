@@ -0,0 +1,153 @@
+import policy_parser
+
+# Versioned schema changes for the policy database. PRAGMA user_version holds
+# the number of migrations applied; each one runs in its own transaction
+# together with the version bump, so a failed step leaves the database as it
+# was before that step and existing rows are carried forward, never dropped.
+
+# kind values in coverage_items, matching the categories text columns
+COVERAGE_KINDS = ('covered', 'not_covered', 'events_covered')
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _base_tables(conn):
+    # Databases made by sunburst_chart.py or older versions of viz.py already
+    # have these tables, sometimes without the later columns
+    conn.execute('''CREATE TABLE IF NOT EXISTS insurance_policies (
+                        id INTEGER PRIMARY KEY,
+                        total_coverage_amount TEXT,
+                        type_of_insurance TEXT,
+                        annual_premium TEXT,
+                        insurer TEXT,
+                        insured TEXT,
+                        issue_date TEXT,
+                        renewal_date TEXT,
+                        policy_number TEXT,
+                        data_version INTEGER NOT NULL DEFAULT 1
+                      )''')
+    if 'data_version' not in _columns(conn, 'insurance_policies'):
+        conn.execute('ALTER TABLE insurance_policies ADD COLUMN data_version INTEGER NOT NULL DEFAULT 1')
+
+    columns = _columns(conn, 'categories')
+    if columns and 'id' not in columns:
+        # viz.py used to create categories without a key; rebuild it with the
+        # implicit rowid as id so coverage items can point at their category
+        conn.execute('ALTER TABLE categories RENAME TO categories_old')
+    conn.execute('''CREATE TABLE IF NOT EXISTS categories (
+                        id INTEGER PRIMARY KEY,
+                        policy_id INTEGER,
+                        category_name TEXT,
+                        covered TEXT,
+                        not_covered TEXT,
+                        events_covered TEXT,
+                        FOREIGN KEY(policy_id) REFERENCES insurance_policies(id)
+                      )''')
+    if columns and 'id' not in columns:
+        kept = [c for c in ('policy_id', 'category_name', 'covered', 'not_covered', 'events_covered') if c in columns]
+        conn.execute(f'''INSERT INTO categories (id, {', '.join(kept)})
+                         SELECT rowid, {', '.join(kept)} FROM categories_old''')
+        conn.execute('DROP TABLE categories_old')
+    elif 'events_covered' not in _columns(conn, 'categories'):
+        conn.execute('ALTER TABLE categories ADD COLUMN events_covered TEXT')
+
+
+def _coverage_items(conn):
+    # One row per covered / not covered item instead of comma joined text
+    conn.execute('''CREATE TABLE coverage_items (
+                        id INTEGER PRIMARY KEY,
+                        policy_id INTEGER NOT NULL,
+                        category_id INTEGER NOT NULL,
+                        kind TEXT NOT NULL,
+                        position INTEGER NOT NULL,
+                        item TEXT NOT NULL,
+                        FOREIGN KEY(policy_id) REFERENCES insurance_policies(id),
+                        FOREIGN KEY(category_id) REFERENCES categories(id)
+                      )''')
+    rows = conn.execute('SELECT id, policy_id, covered, not_covered, events_covered FROM categories')
+    conn.executemany('''INSERT INTO coverage_items (policy_id, category_id, kind, position, item)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     [(policy_id, category_id, kind, position, item)
+                      for category_id, policy_id, *texts in rows.fetchall()
+                      for kind, text in zip(COVERAGE_KINDS, texts)
+                      for position, item in enumerate(policy_parser.split_list(text))])
+
+
+def _numeric_amounts(conn):
+    conn.execute('ALTER TABLE insurance_policies ADD COLUMN total_coverage_amount_value REAL')
+    conn.execute('ALTER TABLE insurance_policies ADD COLUMN annual_premium_value REAL')
+    rows = conn.execute('SELECT id, total_coverage_amount, annual_premium FROM insurance_policies').fetchall()
+    conn.executemany('''UPDATE insurance_policies
+                        SET total_coverage_amount_value = ?, annual_premium_value = ? WHERE id = ?''',
+                     [(policy_parser.parse_amount(total), policy_parser.parse_amount(premium), policy_id)
+                      for policy_id, total, premium in rows])
+
+
+def _indexes(conn):
+    # Chart queries join on policy_id; lookups filter by number and type
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_categories_policy ON categories(policy_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_coverage_items_category ON coverage_items(category_id, kind, position)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_coverage_items_policy ON coverage_items(policy_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_policies_number ON insurance_policies(policy_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_policies_type ON insurance_policies(type_of_insurance)')
+
+
+def _data_version_triggers(conn):
+    # data_version keys the cached chart of a policy, so every change to the
+    # policy, its categories or its items gives it a new one. Versions come from
+    # one counter, so a policy inserted under the id of a deleted one never
+    # repeats a version it had. Items are only inserted together with their
+    # category, which saves a trigger per inserted item
+    conn.execute('CREATE TABLE data_version_counter (value INTEGER NOT NULL)')
+    conn.execute('INSERT INTO data_version_counter (value) SELECT COALESCE(MAX(data_version), 1) FROM insurance_policies')
+    bump = '''UPDATE data_version_counter SET value = value + 1;
+              UPDATE insurance_policies SET data_version = (SELECT value FROM data_version_counter)
+              WHERE id IN ({});'''
+    events = [('insurance_policies', 'INSERT', 'NEW.id'),
+              ('insurance_policies', 'UPDATE OF total_coverage_amount, type_of_insurance, annual_premium, insurer, '
+                                     'insured, issue_date, renewal_date, policy_number', 'NEW.id'),
+              ('categories', 'INSERT', 'NEW.policy_id'), ('categories', 'UPDATE', 'OLD.policy_id, NEW.policy_id'),
+              ('categories', 'DELETE', 'OLD.policy_id'), ('coverage_items', 'UPDATE', 'OLD.policy_id, NEW.policy_id'),
+              ('coverage_items', 'DELETE', 'OLD.policy_id')]
+    for table, event, policy_ids in events:
+        name = f"{table}_{event.split()[0].lower()}_data_version"
+        conn.execute(f'''CREATE TRIGGER {name} AFTER {event} ON {table}
+                         BEGIN
+                             {bump.format(policy_ids)}
+                         END''')
+
+
+# Append only: a database at version N has run exactly the first N of these
+MIGRATIONS = [
+    _base_tables,
+    _coverage_items,
+    _numeric_amounts,
+    _indexes,
+    _data_version_triggers,
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    # Returns the versions that were applied
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if schema_version(conn) >= version:
+            continue
+        # DDL doesn't open a transaction implicitly, so begin one explicitly
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) < version:  # another process may have got here first
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied.append(version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return applied
@@ -0,0 +1,137 @@
+import io
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+# Shared PDF text extraction for the Streamlit chat app (PyPDF2) and the Flask
+# upload app (PyMuPDF). Large documents are split into page ranges that are
+# extracted in a process pool; small ones are read inline.
+EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PdfDocument:
+    def __init__(self, name, pages, seconds):
+        self.name = name
+        self.pages = pages  # list of (page_number, text), page numbers start at 1
+        self.seconds = seconds
+
+    @property
+    def text(self):
+        return ''.join(text for _, text in self.pages)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+        return _pool
+
+
+def _read_source(source):
+    # Paths stay paths so workers can open the file themselves, uploads are
+    # read as bytes
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.fspath(source)), os.fspath(source)
+    if hasattr(source, 'getvalue'):
+        return getattr(source, 'name', 'upload.pdf'), source.getvalue()
+    return 'document.pdf', bytes(source)
+
+
+def _open(data, backend):
+    if backend == 'pymupdf':
+        import fitz  # PyMuPDF
+        if isinstance(data, bytes):
+            return fitz.open(stream=data, filetype='pdf')
+        return fitz.open(data)
+    if backend == 'pypdf2':
+        from PyPDF2 import PdfReader
+        return PdfReader(io.BytesIO(data) if isinstance(data, bytes) else data)
+    raise ValueError(f'Unknown PDF backend: {backend}')
+
+
+def _page_count(doc, backend):
+    return doc.page_count if backend == 'pymupdf' else len(doc.pages)
+
+
+def _extract_range(data, backend, start, stop, doc=None):
+    own_doc = doc is None
+    if own_doc:
+        doc = _open(data, backend)
+    try:
+        pages = []
+        for index in range(start, stop):
+            if backend == 'pymupdf':
+                text = doc[index].get_text()
+            else:
+                text = doc.pages[index].extract_text() or ''
+            pages.append((index + 1, text))
+        return pages
+    finally:
+        if own_doc and backend == 'pymupdf':
+            doc.close()
+
+
+def iter_pages(source, backend='pymupdf'):
+    _, data = _read_source(source)
+    return _iter_pages(data, backend)
+
+
+def _iter_pages(data, backend):
+    doc = _open(data, backend)
+    try:
+        page_count = _page_count(doc, backend)
+        if page_count <= PAGES_PER_TASK or EXTRACT_WORKERS <= 1:
+            yield from _extract_range(data, backend, 0, page_count, doc=doc)
+            return
+    finally:
+        if backend == 'pymupdf':
+            doc.close()
+
+    # Aim for a couple of tasks per worker so uneven pages balance out
+    tasks = min(EXTRACT_WORKERS * 2, math.ceil(page_count / PAGES_PER_TASK))
+    step = math.ceil(page_count / tasks)
+    # uploads are written to a temporary file once and the tasks get its path,
+    # the bytes themselves would be pickled again for every task
+    temp_path = None
+    if isinstance(data, bytes):
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            f.write(data)
+        data = temp_path = f.name
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(_extract_range, data, backend, start, min(start + step, page_count))
+                   for start in range(0, page_count, step)]
+        for future in futures:
+            yield from future.result()
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+
+def extract_document(source, backend='pymupdf', on_page=None):
+    # on_page(page_number) is called as each page's text becomes available
+    started = time.perf_counter()
+    name, data = _read_source(source)
+    pages = []
+    with metrics.span('pdf_extract', backend=backend):
+        for page in _iter_pages(data, backend):
+            pages.append(page)
+            if on_page is not None:
+                on_page(page[0])
+    metrics.inc('pdf_pages_total', len(pages), backend=backend)
+    metrics.inc('pdf_bytes_total', len(data) if isinstance(data, bytes) else os.path.getsize(data), backend=backend)
+    return PdfDocument(name, pages, time.perf_counter() - started)
+
+
+def extract_documents(sources, backend='pymupdf'):
+    return [extract_document(source, backend) for source in sources]
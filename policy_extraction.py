@@ -0,0 +1,228 @@
+import hashlib
+import os
+from typing import List, Dict, Optional
+import db
+import map_reduce
+import metrics
+import migrations
+import pdf_extract
+import policy_parser
+from extraction_cache import ExtractionCache
+
+# Turning a policy PDF into an InsurancePolicyInfo and storing it: text
+# extraction, the LLM summary and its parsing, and the database writes.
+# Shared by the Flask app (viz.py) and batch ingestion (ingest.py), so it
+# imports nothing from Flask.
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+extraction_cache = ExtractionCache(db.DATABASE_PATH)
+
+# Insurance policy information class
+class InsurancePolicyInfo:
+    def __init__(self):
+        self.total_coverage_amount: Optional[str] = None
+        self.insurance_types: List[str] = []
+        self.annual_premium: Optional[str] = None
+        self.insurer: Optional[str] = None
+        self.insured: List[str] = []
+        self.issue_date: Optional[str] = None
+        self.renewal_date: Optional[str] = None
+        self.policy_number: Optional[str] = None
+        self.categories: Dict[str, Dict[str, List[str]]] = {}
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        policy_info = cls()
+        policy_info.__dict__.update(data)
+        return policy_info
+
+# Database setup
+def setup_database():
+    # Brings an existing database up to the current schema, keeping its rows
+    applied = migrations.migrate(db.get_connection())
+    if applied:
+        print(f"Applied schema migrations: {applied}")
+    extraction_cache.setup()
+
+EXTRACTION_MODEL = "text-davinci-003"
+# stream completions so the partial summary reaches /jobs/<id>/events
+STREAM_COMPLETIONS = os.getenv('STREAM_COMPLETIONS', '1') == '1'
+EXTRACTION_PROMPT = (
+    "Please provide a structured summary of this insurance policy in a list format, focusing on specific details. "
+    "Include the following information: \n"
+    "Total coverage amount\n"
+    "Type of insurance\n"
+    "Categories of insurance covered\n"
+    "Details of what is covered under each category\n"
+    "Details of what is not covered under each category\n"
+    "Covered events\n"
+    "Annual premium\n"
+    "Name of the insurer\n"
+    "Name of the insured\n"
+    "Issue date\n"
+    "Renewal date\n"
+    "Policy number\n"
+)
+# cached extractions are only reused for the same prompt, model and segmenting
+EXTRACTION_VERSION = hashlib.sha256(
+    f"{EXTRACTION_MODEL}\n{EXTRACTION_PROMPT}\n{map_reduce.SEGMENT_SIZE}:{map_reduce.SEGMENT_OVERLAP}".encode()
+).hexdigest()[:16]
+
+# openai is imported on first use so the server starts answering requests
+# without waiting for it
+def get_openai():
+    import openai
+    openai.api_key = OPENAI_API_KEY
+    return openai
+
+def retryable_errors(openai):
+    return (
+        openai.error.RateLimitError,
+        openai.error.APIError,
+        openai.error.APIConnectionError,
+        openai.error.ServiceUnavailableError,
+        openai.error.Timeout,
+    )
+
+def extract_text_from_pdf(pdf_path, on_page=None):
+    # pages, bytes and time are recorded by pdf_extract's metrics
+    return pdf_extract.extract_document(pdf_path, backend='pymupdf', on_page=on_page).text
+
+def query_openai_and_parse(text, on_text=None):
+    # Long policies are split into segments that are extracted concurrently and merged.
+    # on_text(segment, delta) receives each segment's summary as it streams in,
+    # delta None meaning a retry restarted that segment
+    segments = map_reduce.split_segments(text) or ['']
+    parts = map_reduce.map_segments(
+        lambda item: query_openai_segment(item[1], on_text and (lambda delta: on_text(item[0], delta))),
+        list(enumerate(segments)))
+    if len(parts) == 1:
+        return parts[0]
+    return merge_policy_infos(parts)
+
+def query_openai_segment(segment, on_text=None):
+    prompt = EXTRACTION_PROMPT + segment
+    openai = get_openai()
+
+    def complete():
+        if on_text is None or not STREAM_COMPLETIONS:
+            with metrics.span('llm_call', model=EXTRACTION_MODEL):
+                response = openai.Completion.create(
+                    model=EXTRACTION_MODEL,
+                    prompt=prompt,
+                    max_tokens=1000  # Limit the completion to 1000 tokens
+                )
+            usage = response.get('usage') or {}
+            metrics.inc('llm_tokens_total', usage.get('prompt_tokens', 0), kind='prompt', source='extraction')
+            metrics.inc('llm_tokens_total', usage.get('completion_tokens', 0), kind='completion',
+                        source='extraction')
+            return response.choices[0].text
+        pieces = []
+        try:
+            with metrics.span('llm_call', model=EXTRACTION_MODEL):
+                for chunk in openai.Completion.create(model=EXTRACTION_MODEL, prompt=prompt, max_tokens=1000,
+                                                      stream=True):
+                    delta = chunk.choices[0].text
+                    if delta:
+                        pieces.append(delta)
+                        on_text(delta)
+        except Exception:
+            if pieces:
+                on_text(None)
+            raise
+        # streamed responses carry no usage, each chunk is one token
+        metrics.inc('llm_tokens_total', len(pieces), kind='completion', source='extraction')
+        return ''.join(pieces)
+
+    metrics.inc('llm_prompt_bytes_total', len(prompt.encode()), source='extraction')
+    extracted_text = map_reduce.call_with_retry(complete, retryable_errors(openai))
+    metrics.inc('llm_completion_bytes_total', len(extracted_text.encode()), source='extraction')
+    return parse_openai_response(extracted_text)
+
+def merge_policy_infos(parts):
+    # Scalars come from the first segment that states them, lists are unioned in segment order
+    merged = InsurancePolicyInfo()
+    for field in ('total_coverage_amount', 'annual_premium', 'insurer', 'issue_date', 'renewal_date', 'policy_number'):
+        values = (getattr(part, field) for part in parts)
+        setattr(merged, field, next((value for value in values if not _is_missing(value)), None))
+    merged.insurance_types = _union(part.insurance_types for part in parts)
+    merged.insured = _union(part.insured for part in parts)
+    for part in parts:
+        for category, details in part.categories.items():
+            target = merged.categories.setdefault(category, {"covered": [], "not_covered": [], "events_covered": []})
+            for key in target:
+                target[key] = _union([target[key], details.get(key, [])])
+    return merged
+
+MISSING_VALUES = {'', 'n/a', 'na', 'none', 'not specified', 'not mentioned', 'not provided', 'unknown'}
+
+def _is_missing(value):
+    return value is None or value.strip().rstrip('.').lower() in MISSING_VALUES
+
+def _union(lists):
+    merged, seen = [], set()
+    for items in lists:
+        for item in items:
+            if item.casefold() not in seen:
+                seen.add(item.casefold())
+                merged.append(item)
+    return merged
+
+
+def parse_openai_response(extracted_text):
+    policy_info = InsurancePolicyInfo()
+    # Read every "Key: value" line once, then look fields up by name
+    with metrics.span('parse'):
+        fields = policy_parser.tokenize(extracted_text)
+
+    # Basic information extraction
+    policy_info.total_coverage_amount = policy_parser.get_field(fields, "Total Coverage Amount")
+    policy_info.annual_premium = policy_parser.get_field(fields, "Annual Premium")
+    policy_info.insurer = policy_parser.get_field(fields, "Name of the Insurer")
+    policy_info.insured = policy_parser.split_items(policy_parser.get_field(fields, "Name of the Insured"), r' & | and ')
+    policy_info.issue_date = policy_parser.get_field(fields, "Issue Date")
+    policy_info.renewal_date = policy_parser.get_field(fields, "Renewal Date")
+    policy_info.policy_number = policy_parser.get_field(fields, "Policy Number")
+
+    # Extracting types of insurance and categories
+    policy_info.insurance_types = policy_parser.split_items(policy_parser.get_field(fields, "Type of Insurance"))
+
+    policy_info.categories = parse_categories(fields)
+    metrics.inc('parsed_categories_total', len(policy_info.categories))
+    return policy_info
+
+def parse_categories(fields):
+    # Categories listed under "Categories of Insurance Covered"
+    return policy_parser.parse_categories(fields)
+
+def insert_data_into_database(policy_info):
+    # Policy row and all of its categories are written in one transaction
+    with db.transaction() as conn:
+        return db.insert_policy(conn, policy_info)
+
+def load_policy_info(policy_id):
+    cursor = db.get_connection().cursor()
+    cursor.execute('''SELECT total_coverage_amount, type_of_insurance, annual_premium, insurer, insured,
+                             issue_date, renewal_date, policy_number
+                      FROM insurance_policies WHERE id = ?''', (policy_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    policy_info = InsurancePolicyInfo()
+    (policy_info.total_coverage_amount, insurance_types, policy_info.annual_premium, policy_info.insurer,
+     insured, policy_info.issue_date, policy_info.renewal_date, policy_info.policy_number) = row
+    policy_info.insurance_types = policy_parser.split_list(insurance_types)
+    policy_info.insured = policy_parser.split_list(insured)
+    cursor.execute("SELECT id, category_name FROM categories WHERE policy_id = ? ORDER BY id", (policy_id,))
+    categories = {}
+    for category_id, category in cursor.fetchall():
+        categories[category_id] = policy_info.categories[category] = {
+            "covered": [], "not_covered": [], "events_covered": []
+        }
+    cursor.execute('''SELECT category_id, kind, item FROM coverage_items
+                      WHERE policy_id = ? ORDER BY category_id, kind, position''', (policy_id,))
+    for category_id, kind, item in cursor.fetchall():
+        categories[category_id][kind].append(item)
+    return policy_info
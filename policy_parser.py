@@ -0,0 +1,89 @@
+import re
+
+# Single pass tokenizer for the LLM's policy summaries. The text is read once
+# and fields are looked up by name, instead of searching the whole text with
+# a regex per field. Lookups keep what that search matched: the first
+# "<keyword>: <value>" in the text, case sensitive, wherever the keyword
+# starts on its line, with the rest of the line as the value. Keywords are
+# matched literally, so category names may contain regex metacharacters.
+
+# a lookup only checks lines whose text before ": " ends like its keyword
+KEY_TAIL = 3
+
+CATEGORIES_KEY = 'Categories of Insurance Covered'
+COVERED_KEY = 'Details of What is Covered under'
+NOT_COVERED_KEY = 'Details of What is Not Covered under'
+
+# First number in an amount such as "$1,250,000.00" or "1.5 million"
+_AMOUNT = re.compile(r'(\d[\d,]*(?:\.\d+)?)\s*(thousand|million|billion|k|m|bn)?\b', re.IGNORECASE)
+_MULTIPLIERS = {'thousand': 1e3, 'k': 1e3, 'million': 1e6, 'm': 1e6, 'billion': 1e9, 'bn': 1e9}
+
+
+def tokenize(text):
+    # For every ": " followed by more of its line, the line up to it and the
+    # rest of the line: all of them in text order under None, and grouped by
+    # the last KEY_TAIL characters of the former
+    pairs = []
+    fields = {None: pairs}
+    for line in text.split('\n'):
+        key, separator, value = line.partition(': ')
+        while separator:
+            if value:
+                pair = (key, value)
+                pairs.append(pair)
+                tail = key[-KEY_TAIL:]
+                if tail in fields:
+                    fields[tail].append(pair)
+                else:
+                    fields[tail] = [pair]
+            if ': ' not in value:
+                break
+            # the same line again up to its next ": "
+            rest, separator, value = value.partition(': ')
+            key = f'{key}: {rest}'
+    return fields
+
+
+def get_field(fields, keyword):
+    for key, value in fields.get(keyword[-KEY_TAIL:] if len(keyword) >= KEY_TAIL else None, ()):
+        if key.endswith(keyword):
+            return value.strip()
+    return None
+
+
+def split_list(value, pattern=None):
+    if not value:
+        return []
+    items = re.split(pattern, value) if pattern else value.split(',')
+    return [item for item in map(str.strip, items) if item]
+
+
+def parse_amount(value):
+    # Numeric value of an amount string, None when it has no number in it
+    match = _AMOUNT.search(value) if value else None
+    if match is None:
+        return None
+    number = float(match.group(1).replace(',', ''))
+    if match.group(2):
+        number *= _MULTIPLIERS[match.group(2).lower()]
+    return number
+
+
+def split_items(value, pattern=None):
+    # Items as the parser has always split them, empty ones included
+    if not value:
+        return []
+    return list(map(str.strip, re.split(pattern, value) if pattern else value.split(',')))
+
+
+def parse_categories(fields):
+    # Categories listed under "Categories of Insurance Covered", with the items
+    # of their details lines
+    return {
+        name: {
+            "covered": split_items(get_field(fields, f"{COVERED_KEY} {name}")),
+            "not_covered": split_items(get_field(fields, f"{NOT_COVERED_KEY} {name}")),
+            "events_covered": [],
+        }
+        for name in split_items(get_field(fields, CATEGORIES_KEY))
+    }
@@ -1,4 +1,5 @@
 import plotly.graph_objects as go
+from sunburst_tree import SunburstTree
 
 class PolicyInfo:
     def __init__(self):
@@ -38,71 +39,56 @@ class PolicyInfo:
             }
         }
 
-def generate_sunburst_chart(policy_info):
-    labels, parents, values, hovertext = [], [], [], []
+def build_sunburst_tree(policy_info):
+    tree = SunburstTree()
 
     # Add the root node
     root_label = f"Total Coverage: {policy_info.total_coverage_amount or 'Not specified'}"
-    labels.append(root_label)
-    parents.append("")
-    values.append(0)  # Start with a base value of 0, will update later
-    hovertext.append(f"Insurer: {policy_info.insurer or 'Not specified'}<br>"
-                     f"Insured: {', '.join(policy_info.insured) or 'Not specified'}<br>"
-                     f"Total Coverage Amount: {policy_info.total_coverage_amount or 'Not specified'}<br>"
-                     f"Annual Premium: {policy_info.annual_premium or 'Not specified'}<br>"
-                     f"Renewal Date: {policy_info.renewal_date or 'Not specified'}<br>"
-                     f"Issue Date: {policy_info.issue_date or 'Not specified'}")
+    tree.add(root_label, "", 0,  # Start with a base value of 0, will update later
+             f"Insurer: {policy_info.insurer or 'Not specified'}<br>"
+             f"Insured: {', '.join(policy_info.insured) or 'Not specified'}<br>"
+             f"Total Coverage Amount: {policy_info.total_coverage_amount or 'Not specified'}<br>"
+             f"Annual Premium: {policy_info.annual_premium or 'Not specified'}<br>"
+             f"Renewal Date: {policy_info.renewal_date or 'Not specified'}<br>"
+             f"Issue Date: {policy_info.issue_date or 'Not specified'}")
 
     # Add nodes for insurance types and categories
     for insurance_type in policy_info.insurance_types:
         type_label = insurance_type
-        labels.append(type_label)
-        parents.append(root_label)
-        values.append(0)  # Start with a base value of 0, will update later
-        hovertext.append(f"Type of Insurance: {insurance_type}")
+        tree.add(type_label, root_label, 0, f"Type of Insurance: {insurance_type}")
 
         for category, details in policy_info.categories.get(insurance_type, {}).items():
             category_label = f"{type_label}: {category}"
-            labels.append(category_label)
-            parents.append(type_label)
-            values.append(0)  # Start with a base value of 0, will update later
-            hovertext.append(f"Category: {category}")
+            tree.add(category_label, type_label, 0, f"Category: {category}")
 
-            # Add covered items
+            # Add covered items, each with a value of 1 for simplicity
             for item in details.get('covered', []):
-                item_label = f"Covered: {item}"
-                labels.append(item_label)
-                parents.append(category_label)
-                values.append(1)  # Assign a value of 1 for simplicity
-                hovertext.append(f"Covered Item: {item}")
+                tree.add(f"Covered: {item}", category_label, 1, f"Covered Item: {item}")
 
             # Add not covered items
             for item in details.get('not_covered', []):
-                item_label = f"Not Covered: {item}"
-                labels.append(item_label)
-                parents.append(category_label)
-                values.append(1)  # Assign a value of 1 for simplicity
-                hovertext.append(f"Not Covered Item: {item}")
+                tree.add(f"Not Covered: {item}", category_label, 1, f"Not Covered Item: {item}")
 
     # Update the values to ensure each parent node's value is the sum of its children
-    for i in range(len(labels) - 1, -1, -1):  # Start from the last item towards the first
-        parent_index = labels.index(parents[i]) if parents[i] else -1
-        if parent_index != -1:
-            values[parent_index] += values[i]
+    return tree.rollup()
+
+def generate_sunburst_chart(policy_info):
+    tree = build_sunburst_tree(policy_info)
 
     # Create the sunburst chart
     fig = go.Figure(go.Sunburst(
-        labels=labels,
-        parents=parents,
-        values=values,
+        labels=tree.labels,
+        parents=tree.parents,
+        values=tree.values,
         hoverinfo="text",
-        hovertext=hovertext,
+        hovertext=tree.hovertext,
         branchvalues="total"
     ))
     fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
 
     return fig
 
-policy_info = PolicyInfo()
-fig = generate_sunburst_chart(policy_info)
-fig.show()
+if __name__ == '__main__':
+    policy_info = PolicyInfo()
+    fig = generate_sunburst_chart(policy_info)
+    fig.show()
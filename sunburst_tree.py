@@ -0,0 +1,58 @@
+# Builds the labels/parents/values/hovertext lists behind a plotly Sunburst.
+# Nodes are indexed by label in a dict, so parent lookups and "already added"
+# checks are O(1) and the value rollup is a single bottom-up pass.
+
+
+class SunburstTree:
+    def __init__(self):
+        self.labels = []
+        self.parents = []
+        self.values = []
+        self.hovertext = []
+        self.colors = []
+        self._index = {}  # label -> index of the first node with that label
+
+    def __contains__(self, label):
+        return label in self._index
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, label, parent, value, hovertext, color=None):
+        index = len(self.labels)
+        self._index.setdefault(label, index)
+        self.labels.append(label)
+        self.parents.append(parent)
+        self.values.append(value)
+        self.hovertext.append(hovertext)
+        self.colors.append(color)
+        return index
+
+    def add_once(self, label, parent, value, hovertext, color=None):
+        # Adds the node unless one with the same label exists
+        if label in self._index:
+            return self._index[label]
+        return self.add(label, parent, value, hovertext, color)
+
+    def rollup(self):
+        # Children always come after their parent, so walking backwards adds
+        # every subtree total into its parent exactly once
+        index = self._index
+        values = self.values
+        parents = self.parents
+        for i in range(len(values) - 1, -1, -1):
+            parent = parents[i]
+            if parent:
+                values[index[parent]] += values[i]
+        return self
+
+    def trace_kwargs(self):
+        kwargs = {
+            'labels': self.labels,
+            'parents': self.parents,
+            'values': self.values,
+            'hovertext': self.hovertext,
+        }
+        if any(color is not None for color in self.colors):
+            kwargs['marker'] = {'colors': self.colors}
+        return kwargs
@@ -0,0 +1,132 @@
+import math
+import os
+import pickle
+import shutil
+import tempfile
+
+# Optional compressed index mode for large corpora. The flat FAISS store stays
+# the source of truth (it is what DocumentIndex updates and index_cache
+# stores); from it a trained IVF-PQ index is written into the same cache entry
+# and memory-mapped for searching, so the vectors live in the page cache,
+# shared by every process serving that entry, instead of in each session.
+INDEX_MODE = os.getenv('INDEX_MODE', 'flat')  # 'flat' or 'ivfpq'
+IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))  # 0 picks ~4 * sqrt(n)
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '16'))
+PQ_M = int(os.getenv('PQ_M', '0'))  # sub-quantizers, 0 picks one per 16 dimensions
+PQ_NBITS = 8
+# PQ alone finds ~0.6 of the true top 10. The k * IVF_REFINE_K best PQ
+# candidates are re-ranked with 8-bit scalar quantized vectors (a quarter of
+# the flat index, memory-mapped too), which brings recall@10 to ~0.97; 0
+# searches the PQ codes only
+IVF_REFINE_K = int(os.getenv('IVF_REFINE_K', '4'))
+# keep faiss' residual table (nlist * m * 256 floats of private memory per
+# process) for 2-3x faster queries, off by default to keep RSS down
+PQ_PRECOMPUTED_TABLE = os.getenv('PQ_PRECOMPUTED_TABLE', '0') == '1'
+# faiss wants about this many training points per centroid, for the coarse
+# lists and for each of the 2**PQ_NBITS centroids of every sub-quantizer
+TRAINING_POINTS_PER_LIST = 39
+PQ_TRAINING_POINTS = TRAINING_POINTS_PER_LIST * 2 ** PQ_NBITS
+# below ~20k vectors flat search is already fast and PQ cannot be trained well
+IVF_MIN_VECTORS = max(int(os.getenv('IVF_MIN_VECTORS', '20000')), PQ_TRAINING_POINTS)
+COMPRESSED_INDEX_NAME = 'ivfpq'
+
+
+def _pq_m(dimensions):
+    m = max(1, dimensions // 16)
+    while dimensions % m:
+        m -= 1
+    return m
+
+
+def build_compressed_index(flat_index, nlist=None, m=None, nprobe=IVF_NPROBE, refine_k=IVF_REFINE_K):
+    import faiss
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    count, dimensions = vectors.shape
+    nlist = nlist or IVF_NLIST or int(4 * math.sqrt(count))
+    nlist = max(1, min(nlist, count // TRAINING_POINTS_PER_LIST))
+    m = m or PQ_M or _pq_m(dimensions)
+    index = ivf = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimensions), dimensions, nlist, m, PQ_NBITS)
+    ivf.nprobe = nprobe
+    if refine_k:
+        index = faiss.IndexRefine(ivf, faiss.IndexScalarQuantizer(dimensions, faiss.ScalarQuantizer.QT_8bit))
+        index.k_factor = refine_k
+    index.train(vectors)
+    # same order as the flat index, so index_to_docstore_id carries over
+    index.add(vectors)
+    return index
+
+
+def ivf_part(index):
+    # the IndexIVFPQ of a compressed index, refined or not
+    import faiss
+    return faiss.downcast_index(faiss.extract_index_ivf(index))
+
+
+def _paths(folder):
+    return (os.path.join(folder, f'{COMPRESSED_INDEX_NAME}.faiss'),
+            os.path.join(folder, f'{COMPRESSED_INDEX_NAME}.pkl'))
+
+
+def save_compressed(vectorstore, folder):
+    import faiss
+    index_path, meta_path = _paths(folder)
+    index = build_compressed_index(vectorstore.index)
+    # write next to the entry and rename, readers never see a partial file
+    tmp_dir = tempfile.mkdtemp(dir=folder, prefix='.tmp-')
+    try:
+        faiss.write_index(index, os.path.join(tmp_dir, 'index.faiss'))
+        with open(os.path.join(tmp_dir, 'index.pkl'), 'wb') as f:
+            pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+        os.replace(os.path.join(tmp_dir, 'index.pkl'), meta_path)
+        os.replace(os.path.join(tmp_dir, 'index.faiss'), index_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return index_path
+
+
+def _is_refined(index_path):
+    # faiss files start with the fourcc of the outer index, IndexRefine is IxRF
+    with open(index_path, 'rb') as f:
+        return f.read(4) == b'IxRF'
+
+
+def load_compressed(folder, embedder):
+    # None until save_compressed has written this entry's compressed index
+    import faiss
+    from langchain.vectorstores import FAISS
+    index_path, meta_path = _paths(folder)
+    if not os.path.exists(index_path):
+        return None
+    # memory-map the refinement codes, the bulk of a refined index (faiss
+    # cannot map them and the inverted lists in the same read), else the lists
+    refined = getattr(faiss, 'IO_FLAG_MMAP_IFC', None) is not None and _is_refined(index_path)
+    flags = faiss.IO_FLAG_MMAP_IFC if refined else faiss.IO_FLAG_MMAP
+    index = faiss.read_index(index_path, flags | faiss.IO_FLAG_READ_ONLY)
+    if not PQ_PRECOMPUTED_TABLE:
+        ivf = ivf_part(index)
+        ivf.use_precomputed_table = -1
+        ivf.precomputed_table.resize(0)
+    with open(meta_path, 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embedder.embed_query, index, docstore, index_to_docstore_id)
+
+
+def is_compressed(vectorstore):
+    import faiss
+    return isinstance(vectorstore.index, (faiss.IndexIVF, faiss.IndexRefine))
+
+
+def serving_store(vectorstore, folder, embedder):
+    # The store to search: the memory-mapped compressed copy in ivfpq mode
+    # once the corpus is large enough to be worth it, else the flat store. Without
+    # its cache entry (not stored, or evicted since) there is nowhere to map from
+    if INDEX_MODE != 'ivfpq' or folder is None or not os.path.isdir(folder) or \
+            vectorstore.index.ntotal < IVF_MIN_VECTORS:
+        return vectorstore
+    if is_compressed(vectorstore):
+        return vectorstore
+    compressed = load_compressed(folder, embedder)
+    if compressed is None:
+        save_compressed(vectorstore, folder)
+        compressed = load_compressed(folder, embedder)
+    return compressed
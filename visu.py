@@ -1,14 +1,46 @@
-import sqlite3
+import itertools
+import db
 import plotly.graph_objects as go
 import plotly.express as px
+from sunburst_tree import SunburstTree
+
+# Define custom colors for insurance types and other elements
+CUSTOM_COLORS = {
+    "Total Coverage": "#FFFFFF",
+    "Life Insurance": "#1f77b4",  # Blue
+    "Health Insurance": "#ff7f0e",  # Orange
+    "Auto Insurance": "#2ca02c",  # Green
+}
+
+# One row per insurance type and category with its item counts, so the chart
+# for the whole book is built from a few rows per category instead of every
+# policy's comma joined item lists
+AGGREGATE_QUERY = '''
+    SELECT COALESCE(p.type_of_insurance, ''), c.category_name,
+           COUNT(DISTINCT p.id),
+           COALESCE(SUM(i.kind = 'covered'), 0),
+           COALESCE(SUM(i.kind = 'not_covered'), 0)
+    FROM insurance_policies p
+    JOIN categories c ON c.policy_id = p.id
+    LEFT JOIN coverage_items i ON i.category_id = c.id
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    '''
+TOTALS_QUERY = '''
+    SELECT COUNT(*), SUM(total_coverage_amount_value), SUM(annual_premium_value)
+    FROM insurance_policies
+    '''
 
 def fetch_data_from_db(db_path, query):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    data = cursor.fetchall()
-    conn.close()
-    return data
+    return db.fetch_all(query, db_path=db_path)
+
+def iter_data_from_db(db_path, query, batch_size=db.FETCH_BATCH_SIZE):
+    return db.iter_rows(query, db_path=db_path, batch_size=batch_size)
+
+def fetch_aggregates_from_db(db_path):
+    # (policy count, total coverage, total premium) and a stream of
+    # (type, category, policies, covered items, not covered items) rows
+    return db.fetch_all(TOTALS_QUERY, db_path=db_path)[0], iter_data_from_db(db_path, AGGREGATE_QUERY)
 
 def generate_hovertext_for_root(data):
     if not data:
@@ -24,83 +56,109 @@ def generate_hovertext_for_root(data):
                 f"Policy Number: {policy_number}"
     return hovertext
 
-def generate_sunburst_chart_from_db(data):
-    # Define custom colors for insurance types and other elements
-    custom_colors = {
-        "Total Coverage": "#FFFFFF",
-        "Life Insurance": "#1f77b4",  # Blue
-        "Health Insurance": "#ff7f0e",  # Orange
-        "Auto Insurance": "#2ca02c",  # Green
-    }
-
-    total_coverage_amount = data[0][1] if data else "Not specified"
-    root_hovertext = generate_hovertext_for_root(data)
-    
-    labels, parents, values, hovertext, colors = ['Total Coverage: ' + total_coverage_amount], [''], [0], [root_hovertext], [custom_colors.get("Total Coverage", "lightgray")]
-
-    for row in data:
+def build_sunburst_tree_from_db(data):
+    # data can be a list or a stream of rows; only the first row is kept
+    custom_colors = CUSTOM_COLORS
+    rows = iter(data)
+    first = next(rows, None)
+    first_rows = [first] if first is not None else []
+
+    total_coverage_amount = first[1] if first is not None else "Not specified"
+    root_label = 'Total Coverage: ' + total_coverage_amount
+    tree = SunburstTree()
+    tree.add(root_label, '', 0, generate_hovertext_for_root(first_rows), custom_colors.get("Total Coverage", "lightgray"))
+
+    for row in itertools.chain(first_rows, rows):
         _, _, type_of_insurance, _, _, _, _, _, _, category_name, covered, not_covered = row
 
         type_label = type_of_insurance + " Insurance"
-        if type_label not in labels:
-            labels.append(type_label)
-            parents.append('Total Coverage: ' + total_coverage_amount)
-            values.append(0)
-            hovertext.append(type_label)
-            colors.append(custom_colors.get(type_label, "#d62728"))  # Default color if not specified
+        tree.add_once(type_label, root_label, 0, type_label,
+                      custom_colors.get(type_label, "#d62728"))  # Default color if not specified
 
         category_label = f"{type_label}: {category_name}"
-        if category_label not in labels:
-            labels.append(category_label)
-            parents.append(type_label)
-            values.append(0)
-            hovertext.append(category_label)
-            colors.append(custom_colors.get("Category", "lightblue"))  # Default category color
+        tree.add_once(category_label, type_label, 0, category_label,
+                      custom_colors.get("Category", "lightblue"))  # Default category color
 
         for item in (covered + ',' + not_covered).split(','):
             if item.strip():
                 item_label = f"{category_label}: {'Covered' if item in covered else 'Not Covered'} - {item.strip()}"
-                labels.append(item_label)
-                parents.append(category_label)
-                values.append(1)
-                hovertext.append(item_label)
-                colors.append(custom_colors.get("Covered" if 'Covered' in item_label else "Not Covered", "lightgreen" if 'Covered' in item_label else "pink"))
+                tree.add(item_label, category_label, 1, item_label,
+                         custom_colors.get("Covered" if 'Covered' in item_label else "Not Covered", "lightgreen" if 'Covered' in item_label else "pink"))
 
     # Update values for types and categories
-    for i in range(len(labels)-1, 0, -1):  # Reverse order to accumulate values
-        parent_index = labels.index(parents[i])
-        values[parent_index] += values[i]
+    return tree.rollup()
+
+def build_sunburst_tree_from_aggregates(totals, rows):
+    # Consumes AGGREGATE_QUERY rows one at a time; memory grows with the
+    # number of types and categories, not with the number of policies
+    custom_colors = CUSTOM_COLORS
+    policies, total_coverage, total_premium = totals
+    root_label = f"Total Coverage: {total_coverage or 0:,.0f}"
+    tree = SunburstTree()
+    tree.add(root_label, '', 0,
+             f"Policies: {policies}<br>"
+             f"Total Coverage Amount: {total_coverage or 0:,.2f}<br>"
+             f"Total Annual Premium: {total_premium or 0:,.2f}",
+             custom_colors.get("Total Coverage", "lightgray"))
+
+    for type_of_insurance, category_name, category_policies, covered, not_covered in rows:
+        type_label = type_of_insurance + " Insurance"
+        tree.add_once(type_label, root_label, 0, type_label, custom_colors.get(type_label, "#d62728"))
+
+        category_label = f"{type_label}: {category_name}"
+        tree.add(category_label, type_label, 0, f"{category_label}<br>Policies: {category_policies}",
+                 custom_colors.get("Category", "lightblue"))
+        if covered:
+            tree.add(f"{category_label}: Covered", category_label, covered,
+                     f"{category_label}<br>Covered items: {covered}", custom_colors.get("Covered", "lightgreen"))
+        if not_covered:
+            tree.add(f"{category_label}: Not Covered", category_label, not_covered,
+                     f"{category_label}<br>Not covered items: {not_covered}", custom_colors.get("Not Covered", "pink"))
 
+    return tree.rollup()
+
+def generate_sunburst_chart_from_db(data):
+    tree = build_sunburst_tree_from_db(data)
+    return _sunburst_figure(tree)
+
+def generate_sunburst_chart_from_aggregates(totals, rows):
+    tree = build_sunburst_tree_from_aggregates(totals, rows)
+    return _sunburst_figure(tree)
+
+def _sunburst_figure(tree):
     # Create the sunburst chart
     fig = go.Figure(go.Sunburst(
-        labels=labels,
-        parents=parents,
-        values=values,
+        labels=tree.labels,
+        parents=tree.parents,
+        values=tree.values,
         hoverinfo="text",
-        hovertext=hovertext,
+        hovertext=tree.hovertext,
         branchvalues="total",
-        marker=dict(colors=colors),
+        marker=dict(colors=tree.colors),
         insidetextorientation='radial'
     ))
     fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
 
     return fig
 
-# Define database path and query
-db_path = 'your_path_insurance_data.db'
-query = '''
-    SELECT p.id, p.total_coverage_amount, p.type_of_insurance, p.annual_premium, p.insurer, 
-           p.insured, p.issue_date, p.renewal_date, p.policy_number, 
-           c.category_name, c.covered, c.not_covered
-    FROM insurance_policies p
-    LEFT JOIN categories c ON p.id = c.policy_id
-    '''
-
-# Fetch data from the database
-db_data = fetch_data_from_db(db_path, query)
-
-# Generate the chart using the fetched data
-fig = generate_sunburst_chart_from_db(db_data)
-fig.show()
-
-
+if __name__ == '__main__':
+    # Define database path and query
+    db_path = 'your_path_insurance_data.db'
+    query = '''
+        SELECT p.id, p.total_coverage_amount, p.type_of_insurance, p.annual_premium, p.insurer, 
+               p.insured, p.issue_date, p.renewal_date, p.policy_number, 
+               c.category_name, c.covered, c.not_covered
+        FROM insurance_policies p
+        LEFT JOIN categories c ON p.id = c.policy_id
+        '''
+
+    # Stream the rows from the database into the chart
+    db_data = iter_data_from_db(db_path, query)
+
+    # Generate the chart using the fetched data
+    fig = generate_sunburst_chart_from_db(db_data)
+    fig.show()
+
+    # Chart of the whole book, aggregated in SQL
+    totals, aggregates = fetch_aggregates_from_db(db_path)
+    generate_sunburst_chart_from_aggregates(totals, aggregates).show()
@@ -1,63 +1,29 @@
 import os
-import sqlite3
-import fitz  # PyMuPDF
-import openai
-import plotly.graph_objects as go
-from flask import Flask, request, render_template, flash, redirect, url_for
+from flask import Flask, Response, request, render_template, render_template_string, flash, redirect, url_for, jsonify
 from werkzeug.utils import secure_filename
-import re  # For regular expressions
-from typing import List, Dict, Optional
+import json
+import threading
+import time
+import db
+import metrics
+from sunburst_tree import SunburstTree
+import uuid
+from jobs import JobQueue, QueueFull
+from chart_cache import ChartCache
+from index_cache import file_digest
+from policy_extraction import (EXTRACTION_VERSION, extract_text_from_pdf, extraction_cache, load_policy_info,
+                               query_openai_and_parse, setup_database)
 
 app = Flask(__name__)
-UPLOAD_FOLDER = 
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
 ALLOWED_EXTENSIONS = {'pdf'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.secret_key = 'your_secret_key'
-openai.api_key = 
-
-# Insurance policy information class
-class InsurancePolicyInfo:
-    def __init__(self):
-        self.total_coverage_amount: Optional[str] = None
-        self.insurance_types: List[str] = []
-        self.annual_premium: Optional[str] = None
-        self.insurer: Optional[str] = None
-        self.insured: List[str] = []
-        self.issue_date: Optional[str] = None
-        self.renewal_date: Optional[str] = None
-        self.policy_number: Optional[str] = None
-        self.categories: Dict[str, Dict[str, List[str]]] = {}
-
-# Database setup
-def setup_database():
-    conn = sqlite3.connect('insurance.db')
-    cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS insurance_policies")
-    cursor.execute("DROP TABLE IF EXISTS categories")
-    cursor.execute('''CREATE TABLE insurance_policies (
-                        id INTEGER PRIMARY KEY,
-                        total_coverage_amount TEXT,
-                        type_of_insurance TEXT,  
-                        annual_premium TEXT,
-                        insurer TEXT,
-                        insured TEXT,
-                        issue_date TEXT,
-                        renewal_date TEXT,
-                        policy_number TEXT
-                      )''')
-    cursor.execute('''CREATE TABLE categories (
-                        policy_id INTEGER,
-                        category_name TEXT,
-                        covered TEXT,
-                        not_covered TEXT,
-                        events_covered TEXT,
-                        FOREIGN KEY(policy_id) REFERENCES insurance_policies(id)
-                      )''')
-    conn.commit()
-    conn.close()
-
-
+job_queue = JobQueue()
+chart_cache = ChartCache()
+# bump when the chart spec format changes so clients drop cached copies
+CHART_SPEC_VERSION = 1
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -73,204 +39,237 @@ def upload_file():
         return redirect(request.url)
     file = request.files['file']
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
+        # unique name so concurrent uploads of the same file don't overwrite each other
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
-        text = extract_text_from_pdf(filepath)
-        policy_info = query_openai_and_parse(text)
-        insert_data_into_database(policy_info)
-        chart_html = generate_sunburst_chart(policy_info)
-        return render_template('screen2.html', chart_html=chart_html)
+        try:
+            refresh = request.values.get('refresh', '').lower() in ('1', 'true', 'yes')
+            job = job_queue.submit(process_saved_upload, filepath, refresh)
+        except QueueFull:
+            os.remove(filepath)
+            return jsonify({'error': 'Too many uploads in progress, try again shortly'}), 503
+        return jsonify({'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}), 202
     else:
         flash('Invalid file type')
         return redirect(request.url)
 
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    doc.close()
-    return text
-
-def query_openai_and_parse(text):
-    truncated_text = text[:3000]  # Truncate to fit within token limits
-
-    prompt = (
-        "Please provide a structured summary of this insurance policy in a list format, focusing on specific details. "
-        "Include the following information: \n"
-        "Total coverage amount\n"
-        "Type of insurance\n"
-        "Categories of insurance covered\n"
-        "Details of what is covered under each category\n"
-        "Details of what is not covered under each category\n"
-        "Covered events\n"
-        "Annual premium\n"
-        "Name of the insurer\n"
-        "Name of the insured\n"
-        "Issue date\n"
-        "Renewal date\n"
-        "Policy number\n" + truncated_text
-    )
-
-    response = openai.Completion.create(
-        model="text-davinci-003", 
-        prompt=prompt,
-        max_tokens=1000  # Limit the completion to 1000 tokens
-    )
-    extracted_text = response.choices[0].text
-    print(extracted_text)
-    return parse_openai_response(extracted_text)
-
-
-def parse_openai_response(extracted_text):
-    policy_info = InsurancePolicyInfo()
-
-    # Basic information extraction
-    policy_info.total_coverage_amount = extract_value_by_keyword(extracted_text, "Total Coverage Amount")
-    policy_info.annual_premium = extract_value_by_keyword(extracted_text, "Annual Premium")
-    policy_info.insurer = extract_value_by_keyword(extracted_text, "Name of the Insurer")
-    insured_str = extract_value_by_keyword(extracted_text, "Name of the Insured")
-    policy_info.insured = [name.strip() for name in re.split(r' & | and ', insured_str)] if insured_str else []
-    policy_info.issue_date = extract_value_by_keyword(extracted_text, "Issue Date")
-    policy_info.renewal_date = extract_value_by_keyword(extracted_text, "Renewal Date")
-    policy_info.policy_number = extract_value_by_keyword(extracted_text, "Policy Number")
-
-    # Extracting types of insurance and categories
-    insurance_types_str = extract_value_by_keyword(extracted_text, "Type of Insurance")
-    policy_info.insurance_types = [insurance_type.strip() for insurance_type in insurance_types_str.split(',')] if insurance_types_str else []
-
-    policy_info.categories = parse_categories(extracted_text)
-
-    print("Parsed Data:", policy_info.__dict__)
-    return policy_info
-
-def parse_categories(text):
-    categories = {}
-    
-    # Assuming categories are listed under "Categories of Insurance Covered"
-    categories_str = extract_value_by_keyword(text, "Categories of Insurance Covered")
-    if categories_str:
-        category_names = [cat.strip() for cat in categories_str.split(',')]
-        for category in category_names:
-            categories[category] = {"covered": [], "not_covered": [], "events_covered": []}
-
-            # Extract details for each category
-            covered_str = extract_value_by_keyword(text, f"Details of What is Covered under {category}")
-            if covered_str:
-                categories[category]["covered"] = [item.strip() for item in covered_str.split(',')]
-
-            not_covered_str = extract_value_by_keyword(text, f"Details of What is Not Covered under {category}")
-            if not_covered_str:
-                categories[category]["not_covered"] = [item.strip() for item in not_covered_str.split(',')]
-
-    # Additional parsing logic for other details as required
-
-    return categories
-
-def extract_value_by_keyword(text, keyword):
-    pattern = rf"{keyword}: ([^\n]+)"
-    match = re.search(pattern, text)
-    if match:
-        return match.group(1).strip()
-    return None
-
-def insert_data_into_database(policy_info):
-    conn = sqlite3.connect('insurance.db')
-    cursor = conn.cursor()
-
-    # Convert the 'insured' list to a string
-    insured_str = ', '.join(policy_info.insured) if policy_info.insured else ''
-    type_of_insurance_str = ', '.join(policy_info.insurance_types) if policy_info.insurance_types else ''
-
-    # Insert main policy data
-    cursor.execute('''INSERT INTO insurance_policies 
-                      (total_coverage_amount, type_of_insurance, annual_premium, insurer, insured, issue_date, renewal_date, policy_number)
-                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', 
-                   (policy_info.total_coverage_amount, type_of_insurance_str, policy_info.annual_premium, 
-                    policy_info.insurer, insured_str, policy_info.issue_date, policy_info.renewal_date, policy_info.policy_number))
-    
-    # Get the last inserted row id (the policy_id)
-    policy_id = cursor.lastrowid
-
-    # Insert category data
-    for category, details in policy_info.categories.items():
-        covered_str = ', '.join(details['covered']) if details['covered'] else ''
-        not_covered_str = ', '.join(details['not_covered']) if details['not_covered'] else ''
-        cursor.execute('''INSERT INTO categories 
-                          (policy_id, category_name, covered, not_covered)
-                          VALUES (?, ?, ?, ?)''', 
-                       (policy_id, category, covered_str, not_covered_str))
-    cursor.execute("SELECT * FROM insurance_policies")
-    print("Insurance Policies:", cursor.fetchall())
-    cursor.execute("SELECT * FROM categories")
-    print("Categories:", cursor.fetchall())
-    conn.commit()
-    conn.close()
-
-def generate_sunburst_chart(policy_info):
+def process_saved_upload(job, filepath, refresh=False):
+    # the saved file is only needed by its job, whatever the outcome
+    try:
+        return process_upload(job, filepath, refresh)
+    finally:
+        os.remove(filepath)
+
+def process_upload(job, filepath, refresh=False):
+    # a PDF already extracted with the current prompt and model skips straight to the chart
+    with job.stage('cache'):
+        doc_hash = file_digest(filepath)
+        cached = None if refresh else extraction_cache.get(doc_hash, EXTRACTION_VERSION)
+    if cached is not None:
+        policy_id, _ = cached
+    else:
+        with job.stage('extract'):
+            text = extract_text_from_pdf(filepath, on_page=lambda page: job.emit('page', {'page': page}))
+        with job.stage('llm'):
+            policy_info = query_openai_and_parse(text, on_text=stream_summary_to_job(job))
+        with job.stage('database'), db.transaction() as conn:
+            policy_id = db.insert_policy(conn, policy_info)
+            extraction_cache.put(doc_hash, EXTRACTION_VERSION, policy_id, policy_info.to_dict(), conn)
+    with job.stage('chart'):
+        # the chart itself is fetched from /policies/<id>/chart, built here once
+        # so the first request for it is served from the cache
+        chart_payload(policy_id, policy_data_version(policy_id))
+    return {'policy_id': policy_id}
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status == 'done':
+        chart_url = url_for('policy_chart', policy_id=job.result['policy_id'])
+        if request.args.get('format') == 'html':
+            return render_template_string(CHART_PAGE, chart_url=chart_url)
+    payload = job.to_dict()
+    if job.status == 'done':
+        payload['policy_id'] = job.result['policy_id']
+        payload['chart_url'] = chart_url
+    return jsonify(payload)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-sent events: stages, extracted pages and the summary text as the
+    # model writes it, then done or failed. A reconnecting client sends the
+    # last id it saw and continues from the next event.
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    status_url = url_for('job_status', job_id=job.id)
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+
+    def stream():
+        position = start
+        while True:
+            position, events = job.wait_events(position, SSE_KEEPALIVE_SECONDS)
+            if not events:
+                if job.finished_at is not None:
+                    return
+                yield ': keepalive\n\n'
+                continue
+            for event, data in events:
+                if event == 'done':
+                    data = {'status_url': status_url}
+                yield f"id: {position}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                position += 1
+                if event in ('done', 'failed'):
+                    return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/policies/<int:policy_id>/chart')
+def policy_chart(policy_id):
+    # Compact plotly figure JSON, cached per policy and data version
+    data_version = policy_data_version(policy_id)
+    if data_version is None:
+        return jsonify({'error': 'Unknown policy'}), 404
+
+    etag = f"{policy_id}-{data_version}-{CHART_SPEC_VERSION}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        payload = chart_payload(policy_id, data_version)
+        if payload is None:
+            return jsonify({'error': 'Unknown policy'}), 404
+        response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def policy_data_version(policy_id):
+    # bumped by the schema's triggers whenever the policy or its categories change
+    row = db.get_connection().execute(
+        "SELECT data_version FROM insurance_policies WHERE id = ?", (policy_id,)).fetchone()
+    return None if row is None else row[0]
+
+def chart_payload(policy_id, data_version):
+    key = (policy_id, data_version)
+    payload = chart_cache.get(key)
+    if payload is None:
+        policy_info = load_policy_info(policy_id)
+        if policy_info is None:
+            return None
+        with metrics.span('chart_tree'):
+            payload = json.dumps(chart_spec(build_policy_tree(policy_info)), separators=(',', ':'))
+        metrics.inc('chart_json_bytes_total', len(payload))
+        chart_cache.put(key, payload)
+    return payload
+
+# /jobs/<id>?format=html: a page that draws the chart from its JSON endpoint
+CHART_PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+    <title>Insurance Sunburst Chart</title>
+    <script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>
+</head>
+<body>
+    <div id="chart" style="width:800px;height:600px"></div>
+    <script>
+        fetch({{ chart_url|tojson }}).then(r => r.json()).then(spec => Plotly.newPlot('chart', spec.data, spec.layout));
+    </script>
+</body>
+</html>'''
+
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(job_queue.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text format: stage latency histograms and token, byte and row counters
+    return Response(metrics.registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+SSE_KEEPALIVE_SECONDS = 15
+def stream_summary_to_job(job):
+    # Forwards streamed summary text to the job's events and records the time
+    # from the first request to the first token as the 'first_token' stage
+    started = time.perf_counter()
+    lock = threading.Lock()
+
+    def on_text(segment, delta):
+        if delta is not None and 'first_token' not in job.stages:
+            with lock:
+                if 'first_token' not in job.stages:
+                    job.record('first_token', time.perf_counter() - started)
+        job.emit('summary', {'segment': segment, 'reset': True} if delta is None else
+                 {'segment': segment, 'text': delta})
+    return on_text
+
+def build_policy_tree(policy_info):
     # Initialize the sunburst chart elements
     total_coverage_amount = policy_info.total_coverage_amount or "Not specified"
     root_label = f"Total Coverage: {total_coverage_amount}"
-    labels = [root_label]  # root node with total coverage amount
-    parents = [""]  # root has no parent
-    values = [100]  # Assign a static value or calculate based on data
-    # Detailed hover information for the center
-    hovertext = [f"Insurer: {policy_info.insurer or 'Not specified'}<br>"
-                 f"Insured: {', '.join(policy_info.insured) or 'Not specified'}<br>"
-                 f"Total Coverage Amount: {total_coverage_amount}<br>"
-                 f"Annual Premium: {policy_info.annual_premium or 'Not specified'}<br>"
-                 f"Renewal Date: {policy_info.renewal_date or 'Not specified'}<br>"
-                 f"Issue Date: {policy_info.issue_date or 'Not specified'}"]
+    tree = SunburstTree()
+    # root node with total coverage amount and detailed hover information for the center
+    tree.add(root_label, "", 100,  # Assign a static value or calculate based on data
+             f"Insurer: {policy_info.insurer or 'Not specified'}<br>"
+             f"Insured: {', '.join(policy_info.insured) or 'Not specified'}<br>"
+             f"Total Coverage Amount: {total_coverage_amount}<br>"
+             f"Annual Premium: {policy_info.annual_premium or 'Not specified'}<br>"
+             f"Renewal Date: {policy_info.renewal_date or 'Not specified'}<br>"
+             f"Issue Date: {policy_info.issue_date or 'Not specified'}")
 
     # Add insurance types as the first layer
     for insurance_type in policy_info.insurance_types:
-        labels.append(insurance_type)
-        parents.append(root_label)
-        values.append(20)  # Adjust value as necessary
-        hovertext.append(f"Type of Insurance: {insurance_type}")
+        tree.add(insurance_type, root_label, 20, f"Type of Insurance: {insurance_type}")  # Adjust value as necessary
 
         # Add categories for each insurance type as the second layer
         for category, details in policy_info.categories.get(insurance_type, {}).items():
-            labels.append(category)
-            parents.append(insurance_type)
-            values.append(10)  # Adjust value as necessary
-            hovertext.append(f"Category: {category}")
+            tree.add(category, insurance_type, 10, f"Category: {category}")
 
             # Add covered and not covered items as the third and fourth layers
-            # Handling covered items
             for item in details.get('covered', []):
-                labels.append(f"Covered: {item}")
-                parents.append(category)
-                values.append(5)  # Adjust value as necessary
-                hovertext.append(f"Covered Item: {item}")
-
-            # Handling not covered items
+                tree.add(f"Covered: {item}", category, 5, f"Covered Item: {item}")
             for item in details.get('not_covered', []):
-                labels.append(f"Not Covered: {item}")
-                parents.append(category)
-                values.append(5)  # Adjust value as necessary
-                hovertext.append(f"Not Covered Item: {item}")
+                tree.add(f"Not Covered: {item}", category, 5, f"Not Covered Item: {item}")
 
-    # Create and configure the sunburst chart
-    fig = go.Figure(go.Sunburst(
-        labels=labels,
-        parents=parents,
-        values=values,
-        hoverinfo="text",
-        hovertext=hovertext,
-        branchvalues="total"
-    ))
-    fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
-    print("Labels:", labels)
-    print("Parents:", parents)
-    print("Values:", values)
-    print("Hovertext:", hovertext)
+    return tree
 
-    # Convert chart to HTML
-    chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn', default_height=600, default_width=800)
+def generate_sunburst_chart(policy_info):
+    # imported on first use so the server starts answering requests without waiting for it
+    import plotly.graph_objects as go
+    with metrics.span('chart_tree'):
+        tree = build_policy_tree(policy_info)
+
+    with metrics.span('chart_render'):
+        # Create and configure the sunburst chart
+        fig = go.Figure(go.Sunburst(
+            labels=tree.labels,
+            parents=tree.parents,
+            values=tree.values,
+            hoverinfo="text",
+            hovertext=tree.hovertext,
+            branchvalues="total"
+        ))
+        fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
+
+        # Convert chart to HTML
+        chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn', default_height=600, default_width=800)
+    metrics.inc('chart_html_bytes_total', len(chart_html))
     return chart_html
 
+def chart_spec(tree):
+    # Same figure as generate_sunburst_chart as plain JSON, for Plotly.newPlot on the client
+    return {
+        'data': [dict(tree.trace_kwargs(), type='sunburst', hoverinfo='text', branchvalues='total')],
+        'layout': {'margin': {'t': 0, 'l': 0, 'r': 0, 'b': 0}},
+    }
+
 if __name__ == '__main__':
     setup_database()
     app.run(debug=True, port=8080)